@@ -6,11 +6,15 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.storage.redis import RedisStorage
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
 
 from app.config.settings import settings
 from app.api.handlers import register_handlers
 from app.api.middlewares import (
+    OutgoingThrottleMiddleware,
     UserContextMiddleware,
+    CommandLogMiddleware,
+    AuthMiddleware,
     RateLimitMiddleware,
     LoggingMiddleware
 )
@@ -56,18 +60,25 @@ async def setup_bot() -> Bot:
         storage = MemoryStorage()
         logger.info("Fallback to in-memory storage for FSM due to error")
     
-    # Create bot instance
+    # Create bot instance; all requests go to one host, so the pool limit is
+    # effectively per-host (aiogram's connector already caches DNS lookups)
     bot = Bot(
         token=settings.bot.TOKEN,
+        session=AiohttpSession(limit=settings.bot.CONNECTION_LIMIT),
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
     
+    # Pace outgoing requests to stay under Telegram's rate limits
+    bot.session.middleware(OutgoingThrottleMiddleware())
+    
     # Create dispatcher
     dp = Dispatcher(storage=storage)
     
     # Register middlewares
     dp.update.middleware(LoggingMiddleware())
-    dp.update.middleware(UserContextMiddleware())
+    dp.message.middleware(UserContextMiddleware())
+    dp.message.middleware(CommandLogMiddleware())
+    dp.message.middleware(AuthMiddleware())
     dp.message.middleware(RateLimitMiddleware())
     
     # Register core handlers
@@ -14,7 +14,8 @@ from app.services.moderation_service import moderation_service
 from app.events.event_manager import event_manager
 from app.models.user import User, UserRole
 from app.models.chat import Chat, ChatMember, ChatMemberStatus
-from app.utils.decorators import admin_required, moderator_required, rate_limit, log_command, chat_type
+from app.utils.decorators import admin_required, moderator_required, rate_limit, log_command
+from app.utils.filters import ChatTypeFilter
 
 
 # Create routers for different command groups
@@ -22,6 +23,12 @@ main_router = Router(name="main")
 admin_router = Router(name="admin")
 moderator_router = Router(name="moderator")
 
+# Moderation and admin commands only make sense in groups; the router-level
+# filter drops other chats before their handlers or message middlewares run
+group_chats = ChatTypeFilter("group", "supergroup")
+moderator_router.message.filter(group_chats)
+admin_router.message.filter(group_chats)
+
 
 # State machine for user input
 class ModeratorActions(StatesGroup):
@@ -128,9 +135,8 @@ async def cmd_help(message: Message, **kwargs):
     await message.reply(help_text)
 
 
-@main_router.message(Command("rules"))
+@main_router.message(Command("rules"), group_chats)
 @log_command
-@chat_type("group", "supergroup")
 async def cmd_rules(message: Message):
     """Handle /rules command"""
     # In a real implementation, this would fetch rules from the database
@@ -148,9 +154,8 @@ async def cmd_rules(message: Message):
     await message.reply(rules_text)
 
 
-@main_router.message(Command("report"))
+@main_router.message(Command("report"), group_chats)
 @log_command
-@chat_type("group", "supergroup")
 @rate_limit(3)
 async def cmd_report(message: Message):
     """Handle /report command"""
@@ -187,7 +192,6 @@ async def cmd_report(message: Message):
 
 @moderator_router.message(Command("warn"))
 @log_command
-@chat_type("group", "supergroup")
 @moderator_required
 async def cmd_warn(message: Message, state: FSMContext):
     """Handle /warn command"""
@@ -210,7 +214,6 @@ async def cmd_warn(message: Message, state: FSMContext):
 
 @moderator_router.message(ModeratorActions.waiting_for_warning_reason)
 @log_command
-@chat_type("group", "supergroup")
 @moderator_required
 async def process_warning_reason(message: Message, state: FSMContext):
     """Process warning reason"""
@@ -257,7 +260,6 @@ async def process_warning_reason(message: Message, state: FSMContext):
 
 @moderator_router.message(Command("mute"))
 @log_command
-@chat_type("group", "supergroup")
 @moderator_required
 async def cmd_mute(message: Message, state: FSMContext):
     """Handle /mute command"""
@@ -411,7 +413,6 @@ async def process_mute_reason(message: Message, state: FSMContext):
 
 @moderator_router.message(Command("unmute"))
 @log_command
-@chat_type("group", "supergroup")
 @moderator_required
 async def cmd_unmute(message: Message):
     """Handle /unmute command"""
@@ -452,7 +453,6 @@ async def cmd_unmute(message: Message):
 
 @admin_router.message(Command("ban"))
 @log_command
-@chat_type("group", "supergroup")
 @admin_required
 async def cmd_ban(message: Message, state: FSMContext):
     """Handle /ban command"""
@@ -2,6 +2,9 @@ from typing import Dict, Any, Callable, Awaitable, Union, Optional, cast
 from aiogram import BaseMiddleware
 from aiogram.types import Message, TelegramObject, Update
 from aiogram.dispatcher.flags import get_flag
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import TelegramMethod
 import time
 from datetime import datetime
 import asyncio
@@ -13,6 +16,84 @@ from app.events.event_manager import event_manager
 from app.models.user import User, UserRole
 from app.services.chat_service import chat_service
 from app.services.rate_limit_service import rate_limit_service
+from app.services.cache_service import cache_service, LRUCache
+from app.config.settings import settings
+from app.utils.permissions import Permissions, current_permissions
+
+
+class TokenBucket:
+    """Token bucket allowing bursts of up to capacity, refilled at rate tokens per second"""
+    
+    def __init__(self, capacity: float, rate: float):
+        """Initialize a full bucket"""
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()  # waiters are served in arrival order
+    
+    async def acquire(self) -> None:
+        """Wait until a token is available and take it"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+    
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for the given number of seconds"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class OutgoingThrottleMiddleware(BaseRequestMiddleware):
+    """Bot session middleware pacing all outgoing Bot API requests
+    
+    Every request takes a token from a bot-wide bucket (30/s by default), and
+    send* requests to groups also take one from that chat's bucket (20/min),
+    matching Telegram's published limits. A TelegramRetryAfter pauses the
+    bot-wide bucket for the requested time before the request is retried once.
+    """
+    
+    def __init__(self, global_rate: int = 30, chat_rate_per_minute: int = 20):
+        """Initialize the buckets"""
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate_per_minute = chat_rate_per_minute
+        self.chat_buckets = LRUCache(max_size=10000)
+    
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Any,
+        method: TelegramMethod,
+    ) -> Any:
+        """Wait for tokens, then send the request"""
+        chat_id = getattr(method, "chat_id", None)
+        if isinstance(chat_id, int) and chat_id < 0 and method.__api_method__.startswith("send"):
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self.chat_buckets[chat_id] = TokenBucket(
+                    self.chat_rate_per_minute, self.chat_rate_per_minute / 60
+                )
+            await bucket.acquire()
+        
+        await self.global_bucket.acquire()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter as e:
+            logger.warning(f"Telegram asked to retry {method.__api_method__} after {e.retry_after}s")
+            self.global_bucket.pause(e.retry_after)
+            await self.global_bucket.acquire()
+            return await make_request(bot, method)
 
 
 class UserUpdateMiddleware(BaseMiddleware):
@@ -204,13 +285,20 @@ class UserContextMiddleware(BaseMiddleware):
             user = message.from_user
             
             if user:
-                # Get or create user in database
-                db_user = await user_service.get_or_create_user(
-                    telegram_id=user.id,
-                    username=user.username,
-                    first_name=user.first_name,
-                    last_name=user.last_name
-                )
+                # Get the user (cached) or create them in the database; without a user
+                # the message is still handled, just without user context
+                try:
+                    db_user = await user_service.get_user_by_telegram_id(user.id)
+                    if db_user is None:
+                        db_user = await user_service.create_or_update_user(
+                            telegram_id=user.id,
+                            username=user.username,
+                            first_name=user.first_name,
+                            last_name=user.last_name
+                        )
+                except Exception as e:
+                    logger.error(f"Error loading user {user.id}: {e}")
+                    return await handler(event, data)
                 
                 # Add user to context
                 data["user"] = {
@@ -222,47 +310,171 @@ class UserContextMiddleware(BaseMiddleware):
                     "is_moderator": db_user.role in [UserRole.ADMIN, UserRole.MODERATOR]
                 }
                 
-                # For group chats, check if user is admin in Telegram
-                if message.chat and message.chat.type in ["group", "supergroup"]:
-                    # Get or create chat in database
-                    db_chat = await chat_service.get_or_create_chat(
-                        telegram_id=message.chat.id,
-                        title=message.chat.title,
-                        chat_type=message.chat.type
-                    )
-                    
-                    # Add chat to context
-                    data["chat"] = {
-                        "id": db_chat.id,
-                        "telegram_id": db_chat.telegram_id,
-                        "title": db_chat.title,
-                        "type": db_chat.chat_type
-                    }
-                    
-                    # Check user permissions in chat
+                # For group chats, check if user is admin in Telegram - only needed by
+                # handlers with a role requirement, so other messages skip the lookups
+                needs_chat_member = (
+                    get_flag(data, "admin_required", default=False)
+                    or get_flag(data, "moderator_required", default=False)
+                )
+                if needs_chat_member and message.chat and message.chat.type in ["group", "supergroup"]:
                     try:
-                        chat_member = await message.chat.get_member(user.id)
-                        is_admin = chat_member.status in ["creator", "administrator"]
+                        # Get or create chat in database
+                        db_chat_id = await chat_service.get_or_create_chat_id(
+                            telegram_id=message.chat.id,
+                            title=message.chat.title,
+                            chat_type=message.chat.type
+                        )
+                        
+                        # Add chat to context
+                        data["chat"] = {
+                            "id": db_chat_id,
+                            "telegram_id": message.chat.id,
+                            "title": message.chat.title,
+                            "type": message.chat.type
+                        }
+                        
+                        # Check user permissions in chat, using the cached status when fresh
+                        status = await chat_service.get_cached_member_status(message.chat.id, user.id)
+                        if status is None:
+                            chat_member = await message.chat.get_member(user.id)
+                            status = chat_member.status
+                            
+                            # Update database with chat member info
+                            await chat_service.update_chat_member(
+                                chat_id=db_chat_id,
+                                user_id=db_user.id,
+                                status=status
+                            )
+                            await chat_service.cache_member_status(message.chat.id, user.id, status)
                         
                         # Add chat member info to context
                         data["chat_member"] = {
-                            "status": chat_member.status,
-                            "is_admin": is_admin
+                            "status": status,
+                            "is_admin": status in ["creator", "administrator"]
                         }
-                        
-                        # Update database with chat member info
-                        await chat_service.update_chat_member(
-                            chat_id=db_chat.id,
-                            user_id=db_user.id,
-                            status=chat_member.status
-                        )
                     except Exception as e:
-                        logger.error(f"Error getting chat member: {e}")
+                        logger.error(f"Error getting chat or chat member: {e}")
+                
+                # Publish the resolved permissions for everything downstream of this message
+                token = current_permissions.set(Permissions(
+                    user_id=user.id,
+                    chat_id=message.chat.id,
+                    role=db_user.role,
+                    chat_status=data.get("chat_member", {}).get("status")
+                ))
+                try:
+                    return await handler(event, data)
+                finally:
+                    current_permissions.reset(token)
         
         # Continue processing
         return await handler(event, data)
 
 
+class CommandLogMiddleware(BaseMiddleware):
+    """Middleware to parse the command name once and log flagged commands"""
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        """Store the command name on data["command_name"] and log it if the handler asks to"""
+        if isinstance(event, Message):
+            # partition() avoids building a list of every word in the message
+            command = (event.text or "").partition(" ")[0]
+            data["command_name"] = command
+            
+            if get_flag(data, "log_command", default=False):
+                user_id = event.from_user.id if event.from_user else "Unknown"
+                logger.info(
+                    f"Command {command or 'Unknown'} used by user {user_id} "
+                    f"in chat {event.chat.id} ({event.chat.type})"
+                )
+        
+        return await handler(event, data)
+
+
+class AuthMiddleware(BaseMiddleware):
+    """Middleware to enforce the access flags set by app.utils.decorators
+    
+    Runs once per message, before the handler, and resolves the user's role at
+    most once regardless of how many flags the handler carries.
+    """
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        """Check chat type and role requirements before processing the message"""
+        if not isinstance(event, Message):
+            return await handler(event, data)
+        
+        # Restrict to specific chat types
+        allowed_types = get_flag(data, "allowed_chat_types")
+        if allowed_types and (not event.chat or event.chat.type not in allowed_types):
+            chat_type_str = event.chat.type if event.chat else "Unknown"
+            await event.reply(
+                f"❌ This command can only be used in {', '.join(allowed_types)} chats.\n"
+                f"Current chat type: {chat_type_str}"
+            )
+            return None
+        
+        admin_required = get_flag(data, "admin_required", default=False)
+        moderator_required = get_flag(data, "moderator_required", default=False)
+        if not admin_required and not moderator_required:
+            return await handler(event, data)
+        
+        user_id = event.from_user.id if event.from_user else None
+        
+        # Admins from settings always pass
+        if user_id and user_id in settings.bot.ADMIN_IDS:
+            return await handler(event, data)
+        
+        role = await self._get_user_role(event, data)
+        
+        if admin_required:
+            if role == UserRole.ADMIN:
+                return await handler(event, data)
+            
+            await event.reply("❌ This command is only available to administrators.")
+            return None
+        
+        # Moderator check - Telegram chat admins count as moderators too
+        is_chat_admin = data.get("chat_member", {}).get("is_admin", False)
+        if role in (UserRole.ADMIN, UserRole.MODERATOR) or is_chat_admin:
+            return await handler(event, data)
+        
+        await event.reply("❌ This command is only available to moderators and administrators.")
+        return None
+    
+    @staticmethod
+    async def _get_user_role(event: Message, data: Dict[str, Any]) -> Optional[str]:
+        """Get the user's role from the context, the role cache or the database"""
+        user_data = data.get("user")
+        if user_data:
+            return user_data.get("role")
+        
+        if not event.from_user:
+            return None
+        
+        # Role-only cache entry, kept up to date by user_service
+        role = await cache_service.get(f"user:role:{event.from_user.id}")
+        if role:
+            return role
+        
+        # Cache miss - read just the auth columns from the database
+        auth_user = await user_service.fetch_auth(event.from_user.id)
+        if auth_user:
+            await user_service.cache_user_role(auth_user.telegram_id, auth_user.role)
+            return auth_user.role
+        
+        return None
+
+
 class RateLimitMiddleware(BaseMiddleware):
     """Middleware to limit requests based on user ID"""
     
@@ -294,8 +506,8 @@ class RateLimitMiddleware(BaseMiddleware):
         limit_requests = rate_limit if isinstance(rate_limit, int) else 1
         limit_period = 60  # 1 minute default
         
-        # Check if we've hit the rate limit
-        is_limited = await rate_limit_service.check_rate_limit(
+        # Check if we've hit the rate limit (the cooldown comes back in the same call)
+        is_limited, cooldown = await rate_limit_service.check_sliding_window(
             key=key,
             limit=limit_requests,
             period=limit_period
@@ -305,7 +517,6 @@ class RateLimitMiddleware(BaseMiddleware):
             # User is rate limited
             if isinstance(event, Message):
                 # Inform user they're rate limited
-                cooldown = await rate_limit_service.get_cooldown(key)
                 await event.reply(
                     f"⚠️ Rate limit exceeded. Please wait {cooldown} seconds before trying again."
                 )
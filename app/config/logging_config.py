@@ -55,12 +55,14 @@ def setup_logging() -> None:
     # Remove default handlers
     logger.remove()
     
-    # Add console handler
+    # Add console handler (enqueue: records are written by a background thread,
+    # so logging never blocks the event loop on I/O)
     logger.add(
         sys.stderr,
         format=log_config.LOG_FORMAT,
         level=log_config.LOG_LEVEL,
         colorize=True,
+        enqueue=True,
     )
     
     # Add file handler if LOG_FILE_PATH is set
@@ -71,6 +73,7 @@ def setup_logging() -> None:
             level=log_config.LOG_LEVEL,
             rotation=log_config.LOG_ROTATION,
             retention=log_config.LOG_RETENTION,
+            enqueue=True,
         )
 
     # Intercept everything at the root logger
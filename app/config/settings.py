@@ -1,5 +1,5 @@
 import os
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Union, FrozenSet
 from pydantic import Field, BaseModel, field_validator
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
@@ -16,8 +16,11 @@ class BotSettings(BaseModel):
     """Bot settings"""
     TOKEN: str = ""
     ADMINS: List[int] = []
+    ADMIN_IDS: FrozenSet[int] = frozenset()  # ADMINS as a set for O(1) membership checks
     SKIPS: List[int] = []
     USE_REDIS: bool = False
+    # Max open connections to the Bot API (purges and broadcasts send many requests at once)
+    CONNECTION_LIMIT: int = 200
 
 
 class APISettings(BaseModel):
@@ -39,6 +42,8 @@ class DatabaseSettings(BaseModel):
     """Database settings"""
     DATABASE_URL: str = "sqlite:///bot.db"
     USE_SQLITE: str = "false"
+    DB_POOL_SIZE: int = 25
+    DB_MAX_OVERFLOW: int = 25
 
 
 class LoggingSettings(BaseModel):
@@ -54,6 +59,8 @@ class RedisSettings(BaseModel):
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
     REDIS_PASSWORD: Optional[str] = None
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: int = 5
 
 
 class Settings(BaseModel):
@@ -98,6 +105,8 @@ if os.getenv("BOT_TOKEN"):
 if os.getenv("ADMINS"):
     settings.bot.ADMINS = [int(admin) for admin in os.getenv("ADMINS").split(",") if admin.strip()]
 
+settings.bot.ADMIN_IDS = frozenset(settings.bot.ADMINS)
+
 if os.getenv("PLUGINS_ENABLED"):
     settings.app.PLUGINS_ENABLED = os.getenv("PLUGINS_ENABLED").split(",")
 
@@ -59,11 +59,19 @@ else:
     # Get async database URL
     db_url = get_async_db_url(settings.db.DATABASE_URL)
 
+# Connection pool sizing only applies to server databases, not SQLite files
+pool_options = {} if db_url.startswith("sqlite") else {
+    "pool_size": settings.db.DB_POOL_SIZE,
+    "max_overflow": settings.db.DB_MAX_OVERFLOW,
+    "pool_pre_ping": True,
+}
+
 # Create async engine for the database
 engine = create_async_engine(
     db_url,
     echo=settings.DEBUG,
     future=True,
+    **pool_options,
 )
 
 # Create session factory
@@ -90,6 +98,16 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
             raise e
 
 
+def get_pool_status() -> str:
+    """Describe current connection pool usage (checked out / idle / overflow)
+    
+    Covers both engines: this module's (schema setup) and app.models.base's,
+    which the services query through.
+    """
+    from app.models.base import engine as models_engine
+    return f"session: {engine.pool.status()}; models: {models_engine.pool.status()}"
+
+
 async def init_db() -> None:
     """Initialize the database"""
     # Create directory for SQLite database if needed
@@ -109,4 +127,8 @@ async def init_db() -> None:
         from app.models.chat import Chat, ChatMember
         
         # Create tables if they don't exist
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
+    
+    # Add columns introduced since the tables were created
+    from app.models.base import upgrade_schema
+    await upgrade_schema()
@@ -1,6 +1,6 @@
 import asyncio
 import inspect
-from typing import Dict, List, Any, Callable, Awaitable, Set, Optional, Union
+from typing import Dict, List, Any, Callable, Awaitable, Set, Optional, Union, Tuple
 from loguru import logger
 import pika
 import json
@@ -78,6 +78,39 @@ class EventManager:
         
         return True
     
+    async def publish_batch(self, events: List[Tuple[str, Dict[str, Any]]]) -> bool:
+        """Publish several (event_type, data) events with a single queue put"""
+        if not events:
+            return True
+        
+        if not self.connected:
+            logger.warning(f"Event manager not connected, can't publish {len(events)} batched events")
+            return False
+        
+        timestamp = datetime.utcnow().isoformat()
+        batch = [
+            {"type": event_type, "timestamp": timestamp, "data": data}
+            for event_type, data in events
+        ]
+        
+        # Add to queue as one item; the worker dispatches each event in order
+        await self._queue.put(batch)
+        
+        return True
+    
+    async def _dispatch(self, event: Dict[str, Any]) -> None:
+        """Deliver a single event to its subscribers"""
+        event_type = event.get("type")
+        
+        # Check if anyone is subscribed to this event
+        if event_type in self.events and self.events[event_type]:
+            # Call all subscribers
+            for callback in self.events[event_type]:
+                try:
+                    await callback(event)
+                except Exception as e:
+                    logger.error(f"Error in event subscriber for {event_type}: {e}")
+    
     def subscribe(self, event_type: str, callback: Callable[[Dict[str, Any]], Awaitable[None]]) -> None:
         """Subscribe to an event type"""
         if event_type not in self.events:
@@ -110,16 +143,12 @@ class EventManager:
                 except asyncio.TimeoutError:
                     continue
                 
-                event_type = event.get("type")
-                
-                # Check if anyone is subscribed to this event
-                if event_type in self.events and self.events[event_type]:
-                    # Call all subscribers
-                    for callback in self.events[event_type]:
-                        try:
-                            await callback(event)
-                        except Exception as e:
-                            logger.error(f"Error in event subscriber for {event_type}: {e}")
+                # Batches from publish_batch arrive as a list of events
+                if isinstance(event, list):
+                    for batched_event in event:
+                        await self._dispatch(batched_event)
+                else:
+                    await self._dispatch(event)
                 
                 # Mark task as done
                 self._queue.task_done()
@@ -9,6 +9,7 @@ import traceback
 # Import config first to ensure settings are loaded
 from app.config.settings import settings
 from app.config.logging_config import setup_logging
+from app.utils.helpers import install_uvloop
 
 
 async def start_services():
@@ -60,7 +61,8 @@ def main():
     signal.signal(signal.SIGTERM, handle_exit)
     
     try:
-        # Start the event loop
+        # Start the event loop, using the faster libuv-based loop when available
+        install_uvloop()
         loop = asyncio.get_event_loop()
         loop.run_until_complete(start_services())
         loop.run_forever()
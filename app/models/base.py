@@ -1,7 +1,8 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import declarative_base, sessionmaker
 from sqlalchemy.sql import func
-from sqlalchemy import Column, DateTime, Integer, create_engine
+from sqlalchemy import Column, DateTime, Integer, create_engine, inspect
+from sqlalchemy.schema import CreateColumn
 from contextlib import asynccontextmanager
 from typing import AsyncGenerator
 from loguru import logger
@@ -29,6 +30,12 @@ else:
         engine = create_async_engine(
             settings.db.DATABASE_URL,
             echo=settings.DEBUG,
+            # Connection pool sizing only applies to server databases, not SQLite files
+            **({} if settings.db.DATABASE_URL.startswith("sqlite") else {
+                "pool_size": settings.db.DB_POOL_SIZE,
+                "max_overflow": settings.db.DB_MAX_OVERFLOW,
+                "pool_pre_ping": True,
+            }),
         )
         logger.info(f"Connected to database: {settings.db.DATABASE_URL}")
     except Exception as e:
@@ -74,6 +81,42 @@ async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
         await session.close()
 
 
+def _add_missing_columns(conn) -> None:
+    """Add nullable model columns missing from existing tables
+    
+    create_all only creates missing tables, so columns added to a model later
+    (e.g. chats.goodbye_message) have to be added to existing databases here.
+    """
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            if not column.nullable:
+                logger.warning(f"Column {table.name}.{column.name} is missing and must be added manually")
+                continue
+            
+            column_ddl = CreateColumn(column).compile(dialect=conn.dialect)
+            conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}")
+            logger.info(f"Added missing column {table.name}.{column.name}")
+
+
+async def upgrade_schema() -> None:
+    """Bring existing tables up to date with the models"""
+    # Import models to ensure they're registered with Base
+    from app.models.user import User
+    from app.models.chat import Chat, ChatMember
+    
+    async with engine.begin() as conn:
+        await conn.run_sync(_add_missing_columns)
+
+
 async def init_db() -> None:
     """Initialize database."""
     logger.info("Initializing the database...")
@@ -81,6 +124,7 @@ async def init_db() -> None:
         async with engine.begin() as conn:
             # await conn.run_sync(Base.metadata.drop_all)
             await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(_add_missing_columns)
         logger.info("Database initialized.")
     except Exception as e:
         logger.error(f"Error initializing database: {e}")
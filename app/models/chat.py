@@ -42,6 +42,7 @@ class Chat(BaseModel):
     
     # Settings
     welcome_message = Column(Text, nullable=True)
+    goodbye_message = Column(Text, nullable=True)
     rules = Column(Text, nullable=True)
     language = Column(String(10), default="en")
     auto_delete_service_messages = Column(Boolean, default=True)
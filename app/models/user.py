@@ -37,6 +37,14 @@ class User(BaseModel):
     # Relationships
     chats = relationship("ChatMember", back_populates="user")
     
+    # Field order of the packed cache entry (see CacheService.encode_model);
+    # only append, entries with a different field count are treated as stale
+    __cache_fields__ = (
+        "id", "telegram_id", "username", "first_name", "last_name", "language_code",
+        "role", "is_active", "warnings_count", "is_banned", "ban_reason", "ban_date",
+        "created_at", "updated_at"
+    )
+    
     def __repr__(self) -> str:
         return f"<User(id={self.id}, telegram_id={self.telegram_id}, username={self.username}, role={self.role})>"
         
@@ -1,10 +1,10 @@
 import os
 import importlib
+import importlib.util
 import inspect
 import pkgutil
-from typing import Dict, List, Optional, Any, Callable, Type
+from typing import Dict, List, Optional, Any, Callable, Type, Set
 from loguru import logger
-import traceback
 from pydantic import BaseModel
 import sys
 
@@ -35,15 +35,18 @@ class PluginBase:
     def __init__(self, manager: 'PluginManager'):
         self.manager = manager
         self.is_active = False
+        self._handlers_cache: Optional[Dict[str, Callable]] = None
     
     async def activate(self) -> bool:
         """Activate the plugin"""
+        self._handlers_cache = None
         self.is_active = True
         logger.info(f"Plugin {self.metadata.name} v{self.metadata.version} activated")
         return True
     
     async def deactivate(self) -> bool:
         """Deactivate the plugin"""
+        self._handlers_cache = None
         self.is_active = False
         logger.info(f"Plugin {self.metadata.name} deactivated")
         return True
@@ -56,6 +59,15 @@ class PluginBase:
         """Get plugin middlewares"""
         return []
     
+    def _prefixed_handlers(self, plugin_name: str) -> Dict[str, Callable]:
+        """Get command handlers keyed by "plugin.command", cached until re-activation"""
+        if self._handlers_cache is None:
+            self._handlers_cache = {
+                f"{plugin_name}.{command}": handler
+                for command, handler in self.get_handlers().items()
+            }
+        return self._handlers_cache
+    
     def __str__(self) -> str:
         return f"{self.metadata.name} v{self.metadata.version}"
 
@@ -63,6 +75,9 @@ class PluginBase:
 class PluginManager:
     """Manager for loading and managing plugins"""
     
+    # Plugin directories already added to sys.path (shared across instances)
+    _paths_registered: Set[str] = set()
+    
     def __init__(self):
         """Initialize the plugin manager"""
         self.plugins: Dict[str, PluginBase] = {}
@@ -77,10 +92,14 @@ class PluginManager:
             os.path.join(os.path.dirname(__file__), "builtin")  # Built-in plugins
         ]
         
-        # Ensure plugin directories are in Python path
+        # Ensure plugin directories are in Python path (once per canonical path)
         for plugin_dir in self.plugin_dirs:
-            if os.path.exists(plugin_dir) and plugin_dir not in sys.path:
-                sys.path.insert(0, plugin_dir)
+            path = os.path.realpath(plugin_dir)
+            if path in PluginManager._paths_registered or not os.path.exists(path):
+                continue
+            if path not in sys.path:
+                sys.path.insert(0, path)
+            PluginManager._paths_registered.add(path)
                 
         logger.debug(f"Plugin directories: {self.plugin_dirs}")
         logger.debug(f"Python path: {sys.path}")
@@ -132,14 +151,27 @@ class PluginManager:
                 logger.warning(f"Plugin directory exists but missing __init__.py: {plugin_path}")
                 continue
             
-            # Try to import the module
+            # Probe for the module spec first so a miss doesn't raise ImportError
+            logger.debug(f"Attempting to import plugin module '{plugin_name}' from {plugin_dir}")
+            spec = importlib.util.find_spec(plugin_name)
+            if spec is None or spec.loader is None:
+                logger.debug(f"No module spec found for '{plugin_name}'")
+                continue
+            
+            # Reuse the module if it was already imported
+            if plugin_name in sys.modules:
+                plugin_module = sys.modules[plugin_name]
+                break
+            
             try:
-                logger.debug(f"Attempting to import plugin module '{plugin_name}' from {plugin_dir}")
-                # Use relative import if the directory is in sys.path
-                plugin_module = importlib.import_module(plugin_name)
+                plugin_module = importlib.util.module_from_spec(spec)
+                sys.modules[plugin_name] = plugin_module
+                spec.loader.exec_module(plugin_module)
                 logger.debug(f"Successfully imported plugin module '{plugin_name}'")
                 break
             except ImportError as e:
+                sys.modules.pop(plugin_name, None)
+                plugin_module = None
                 logger.debug(f"Import failed for '{plugin_name}': {e}")
                 continue
         
@@ -148,10 +180,14 @@ class PluginManager:
             return None
         
         # Find plugin class (must be a subclass of PluginBase)
+        checked = set()
         for name, obj in inspect.getmembers(plugin_module):
-            if (inspect.isclass(obj) and 
-                issubclass(obj, PluginBase) and 
-                obj is not PluginBase):
+            if not isinstance(obj, type) or obj in checked:
+                continue
+            checked.add(obj)
+            
+            # Plain MRO lookup avoids issubclass() hooks on every module attribute
+            if PluginBase in obj.__mro__ and obj is not PluginBase:
                 plugin_class = obj
                 logger.debug(f"Found plugin class {name} in module {plugin_name}")
                 break
@@ -163,12 +199,16 @@ class PluginManager:
         # Create plugin instance
         try:
             plugin = plugin_class(self)
+            
+            # Freeze dependency metadata once instead of re-reading it on every check
+            plugin._requires_fs = frozenset(plugin.metadata.requires)
+            plugin._conflicts_fs = frozenset(plugin.metadata.conflicts)
+            
             self.plugins[plugin_name] = plugin
             logger.info(f"Loaded plugin: {plugin}")
             return plugin
         except Exception as e:
-            logger.error(f"Error creating plugin instance {plugin_name}: {e}")
-            logger.debug(traceback.format_exc())
+            logger.opt(exception=True).error(f"Error creating plugin instance {plugin_name}: {e}")
             return None
     
     async def activate_plugin(self, plugin_name: str) -> bool:
@@ -190,7 +230,7 @@ class PluginManager:
             return True
         
         # Check dependencies
-        for dependency in plugin.metadata.requires:
+        for dependency in plugin._requires_fs:
             if dependency not in self.active_plugins:
                 # Try to activate dependency
                 if not await self.activate_plugin(dependency):
@@ -198,7 +238,7 @@ class PluginManager:
                     return False
         
         # Check conflicts
-        for conflict in plugin.metadata.conflicts:
+        for conflict in plugin._conflicts_fs:
             if conflict in self.active_plugins:
                 logger.error(f"Plugin {plugin_name} conflicts with active plugin {conflict}")
                 return False
@@ -213,8 +253,7 @@ class PluginManager:
                 logger.error(f"Plugin {plugin_name} activation failed")
                 return False
         except Exception as e:
-            logger.error(f"Error activating plugin {plugin_name}: {e}")
-            logger.debug(traceback.format_exc())
+            logger.opt(exception=True).error(f"Error activating plugin {plugin_name}: {e}")
             return False
     
     async def deactivate_plugin(self, plugin_name: str) -> bool:
@@ -230,7 +269,7 @@ class PluginManager:
         
         # Check if any active plugins depend on this one
         for active_name, active_plugin in self.active_plugins.items():
-            if plugin_name in active_plugin.metadata.requires:
+            if plugin_name in active_plugin._requires_fs:
                 logger.error(f"Cannot deactivate {plugin_name}: Plugin {active_name} depends on it")
                 return False
         
@@ -244,20 +283,16 @@ class PluginManager:
                 logger.error(f"Plugin {plugin_name} deactivation failed")
                 return False
         except Exception as e:
-            logger.error(f"Error deactivating plugin {plugin_name}: {e}")
-            logger.debug(traceback.format_exc())
+            logger.opt(exception=True).error(f"Error deactivating plugin {plugin_name}: {e}")
             return False
     
     async def get_all_plugin_handlers(self) -> Dict[str, Callable]:
         """Get command handlers from all active plugins"""
         handlers = {}
         
+        # Plugin name is added as a prefix to avoid conflicts
         for plugin_name, plugin in self.active_plugins.items():
-            plugin_handlers = plugin.get_handlers()
-            
-            # Add plugin name as a prefix to avoid conflicts
-            for command, handler in plugin_handlers.items():
-                handlers[f"{plugin_name}.{command}"] = handler
+            handlers.update(plugin._prefixed_handlers(plugin_name))
         
         return handlers
     
@@ -1,21 +1,87 @@
 import json
 import asyncio
-from typing import Any, Dict, List, Optional, Union, TypeVar, Generic, Type
+import fnmatch
+import heapq
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union, TypeVar, Generic, Type, Tuple
 import redis.asyncio as redis
 from loguru import logger
 from pydantic import BaseModel
-from datetime import timedelta, datetime
+from sqlalchemy import DateTime
+from datetime import datetime
+import time
+import math
+import uuid
+from collections import OrderedDict, deque
 
 from app.config.settings import settings
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 T = TypeVar('T')
 
 
+# Use orjson when available - it is several times faster than the stdlib json module
+if orjson is not None:
+    def json_dumps(value: Any) -> str:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+    
+    json_loads = orjson.loads
+else:
+    json_dumps = json.dumps
+    json_loads = json.loads
+
+
+# Leading byte of packed model entries (see CacheService.encode_model); it can't
+# start a JSON document, so legacy JSON entries are told apart without parsing
+MODEL_CACHE_VERSION = "\x01"
+
+
+class LRUCache(OrderedDict):
+    """Bounded dict that evicts the least recently used key once max_size is exceeded"""
+    def __init__(self, max_size: int = 10000, on_evict: Optional[Callable[[str], Any]] = None):
+        super().__init__()
+        self.max_size = max_size
+        self.on_evict = on_evict
+    
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.max_size:
+            evicted, _ = self.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(evicted)
+    
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+    
+    def get(self, key, default=None):
+        """Get a value, marking the key as recently used on a hit"""
+        if key in self:
+            return self[key]
+        return default
+
+
 class DummyCache:
     """In-memory cache for when Redis is not available"""
     def __init__(self):
         self.cache = {}
         self.ttls = {}
+        self._exp_heap = []  # (expiry, key) min-heap, may hold stale entries
+    
+    def _cleanup(self, now):
+        """Drop expired keys, touching only the entries that have expired"""
+        heap = self._exp_heap
+        while heap and heap[0][0] <= now:
+            expiry, key = heapq.heappop(heap)
+            # Skip stale heap entries left behind by a later set()
+            if self.ttls.get(key) == expiry:
+                del self.cache[key]
+                del self.ttls[key]
     
     async def ping(self):
         return True
@@ -27,14 +93,19 @@ class DummyCache:
             return self.cache[key]
         # Remove expired keys
         if key in self.ttls and self.ttls[key] <= now:
-            del self.cache[key]
-            del self.ttls[key]
+            self.cache.pop(key, None)
+            self.ttls.pop(key, None)
         return None
     
     async def set(self, key, value, ex=None):
+        now = asyncio.get_event_loop().time()
+        self._cleanup(now)
         self.cache[key] = value
         if ex:
-            self.ttls[key] = asyncio.get_event_loop().time() + ex
+            self.ttls[key] = now + ex
+            heapq.heappush(self._exp_heap, (now + ex, key))
+        else:
+            self.ttls.pop(key, None)
         return True
     
     async def delete(self, key):
@@ -52,6 +123,7 @@ class DummyCache:
     async def flushdb(self):
         self.cache.clear()
         self.ttls.clear()
+        self._exp_heap.clear()
         return True
     
     async def close(self):
@@ -61,23 +133,72 @@ class DummyCache:
 class CacheService:
     """Service for caching data"""
     
+    # Increment a counter, start its expiry window on first use and report
+    # the remaining TTL, all in one round-trip
+    INCR_EXPIRE_SCRIPT = """
+local count = redis.call('INCR', KEYS[1])
+if count == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return {count, redis.call('TTL', KEYS[1])}
+"""
+    
+    # Sliding window log: drop entries older than the window, record this hit,
+    # and report the hit count plus ms until the oldest hit leaves the window
+    SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - window)
+redis.call('ZADD', KEYS[1], now, ARGV[3])
+redis.call('PEXPIRE', KEYS[1], window)
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return {redis.call('ZCARD', KEYS[1]), tonumber(oldest[2]) + window - now}
+"""
+    
+    # Max keys held by the in-memory fallback before evicting the least recently used
+    IN_MEMORY_MAX_SIZE = 10000
+    
     def __init__(self):
         """Initialize cache service"""
         self.connected = False
         self.client = None
-        self.in_memory_cache = {}
+        self._pool = None
+        self.in_memory_cache = self._new_in_memory_cache()
         self.in_memory_ttl = {}
+        self._exp_heap: List[Tuple[float, str]] = []  # (expiry, key), may hold stale entries
+        self._cleanup_task: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
+        self._scripts: Dict[str, Any] = {}
+        # In-memory sliding windows (key -> deque of monotonic hit times), kept out of
+        # in_memory_cache so hits don't push TTL heap entries; stale keys fall off the LRU end
+        self._windows: LRUCache = LRUCache(max_size=self.IN_MEMORY_MAX_SIZE)
     
     async def connect(self) -> bool:
-        """Connect to Redis if configured, otherwise use in-memory cache"""
+        """Connect to Redis if configured, otherwise use in-memory cache
+        
+        Concurrent callers share a single connection attempt.
+        """
+        if self.connected:
+            return True
+        
+        async with self._connect_lock:
+            if self.connected:
+                return True
+            return await self._do_connect()
+    
+    async def _do_connect(self) -> bool:
+        """Open the Redis connection or fall back to the in-memory cache"""
         if settings.redis.REDIS_URL:
             try:
-                # Connect to Redis
-                self.client = redis.from_url(
+                # Connect to Redis through a shared, bounded connection pool
+                self._pool = redis.BlockingConnectionPool.from_url(
                     settings.redis.REDIS_URL,
+                    max_connections=settings.redis.REDIS_MAX_CONNECTIONS,
+                    timeout=settings.redis.REDIS_POOL_TIMEOUT,
                     encoding="utf-8",
                     decode_responses=True
                 )
+                self.client = redis.Redis(connection_pool=self._pool)
                 
                 # Test connection
                 await self.client.ping()
@@ -90,12 +211,15 @@ class CacheService:
                 logger.warning(f"Failed to connect to Redis: {e}")
                 logger.warning("Using in-memory cache instead")
                 self.client = None
+                await self._close_pool()
         
         # Use in-memory if Redis not available or connection failed
         if not self.connected:
             logger.info("Using in-memory cache")
-            self.in_memory_cache = {}
+            self.in_memory_cache = self._new_in_memory_cache()
             self.in_memory_ttl = {}
+            self._exp_heap = []
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
             self.connected = True
         
         return self.connected
@@ -105,10 +229,63 @@ class CacheService:
         if self.client:
             await self.client.close()
             self.client = None
+        await self._close_pool()
+        
+        if self._cleanup_task and not self._cleanup_task.done():
+            self._cleanup_task.cancel()
+        self._cleanup_task = None
         
         self.connected = False
         logger.info("Disconnected from cache")
     
+    def _new_in_memory_cache(self) -> LRUCache:
+        """Create the bounded in-memory store, dropping the TTL of evicted keys"""
+        return LRUCache(
+            max_size=self.IN_MEMORY_MAX_SIZE,
+            on_evict=lambda key: self.in_memory_ttl.pop(key, None)
+        )
+    
+    def _set_in_memory_ttl(self, key: str, ttl: int) -> None:
+        """Set the expiry of an in-memory key and schedule it for cleanup"""
+        expiry = time.monotonic() + ttl
+        self.in_memory_ttl[key] = expiry
+        heapq.heappush(self._exp_heap, (expiry, key))
+    
+    def _cleanup(self) -> int:
+        """Remove expired in-memory keys
+        
+        Pops only the expired heap entries, so the cost is proportional to the
+        number of expired keys rather than the size of the cache.
+        """
+        now = time.monotonic()
+        heap = self._exp_heap
+        removed = 0
+        while heap and heap[0][0] <= now:
+            expiry, key = heapq.heappop(heap)
+            # Skip stale entries whose TTL was changed or removed since
+            if self.in_memory_ttl.get(key) == expiry:
+                self.in_memory_cache.pop(key, None)
+                del self.in_memory_ttl[key]
+                removed += 1
+        return removed
+    
+    async def _cleanup_loop(self, interval: float = 5.0) -> None:
+        """Background task that periodically removes expired in-memory keys"""
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                removed = self._cleanup()
+                if removed:
+                    logger.debug(f"Removed {removed} expired keys from in-memory cache")
+        except asyncio.CancelledError:
+            pass
+    
+    async def _close_pool(self) -> None:
+        """Close all connections in the Redis connection pool"""
+        if self._pool:
+            await self._pool.disconnect()
+            self._pool = None
+    
     async def get(self, key: str) -> Any:
         """Get a value from cache"""
         if not self.connected:
@@ -123,7 +300,7 @@ class CacheService:
                 
                 try:
                     # Try to parse as JSON
-                    return json.loads(value)
+                    return json_loads(value)
                 except json.JSONDecodeError:
                     # Return as string if not JSON
                     return value
@@ -135,16 +312,134 @@ class CacheService:
         # Get from in-memory cache
         if key in self.in_memory_cache:
             # Check if expired
-            if key in self.in_memory_ttl and self.in_memory_ttl[key] < datetime.now():
+            if key in self.in_memory_ttl and self.in_memory_ttl[key] < time.monotonic():
                 # Expired - remove and return None
                 del self.in_memory_cache[key]
                 del self.in_memory_ttl[key]
                 return None
             
+            # Mark as recently used
+            self.in_memory_cache.move_to_end(key)
             return self.in_memory_cache[key]
         
         return None
     
+    async def _get_raw(self, key: str) -> Any:
+        """Get a value from cache without JSON decoding"""
+        if not self.connected:
+            return None
+        
+        # Get from Redis
+        if self.client:
+            try:
+                return await self.client.get(key)
+            except Exception as e:
+                logger.error(f"Error getting key '{key}' from Redis: {e}")
+                return None
+        
+        return await self.get(key)
+    
+    async def get_json(self, key: str) -> Optional[Union[Dict[str, Any], List[Any]]]:
+        """Get a JSON object or array from cache"""
+        value = await self.get(key)
+        return value if isinstance(value, (dict, list)) else None
+    
+    async def set_json(self, key: str, value: Union[Dict[str, Any], List[Any]], ttl: Optional[int] = None) -> bool:
+        """Store a JSON object or array in cache"""
+        return await self.set(key, value, ttl=ttl)
+    
+    async def get_model(self, key: str, model_cls: Type[T]) -> Optional[T]:
+        """Get a model instance from cache
+        
+        Pydantic v2 models are validated straight from the raw JSON string,
+        skipping the intermediate dict.
+        """
+        raw = await self._get_raw(key)
+        if raw is None:
+            return None
+        
+        try:
+            return self.decode_model(model_cls, raw)
+        except Exception as e:
+            logger.error(f"Error loading model {model_cls.__name__} from key '{key}': {e}")
+            return None
+    
+    async def set_model(self, key: str, model: Any, ttl: Optional[int] = None) -> bool:
+        """Store a pydantic or SQLAlchemy model in cache"""
+        return await self.set(key, self.encode_model(model), ttl=ttl)
+    
+    @classmethod
+    def encode_model(cls, model: Any) -> Any:
+        """Serialize a model for caching
+        
+        Models that declare __cache_fields__ are packed as a version byte plus a
+        JSON array of those fields in order, leaving the field names out of the payload.
+        Other models are stored as a dict.
+        """
+        fields = getattr(type(model), "__cache_fields__", None)
+        if fields is None:
+            return cls._model_to_dict(model)
+        
+        values = []
+        for name in fields:
+            value = getattr(model, name)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            values.append(value)
+        return MODEL_CACHE_VERSION + json_dumps(values)
+    
+    @classmethod
+    def decode_model(cls, model_cls: Type[T], raw: Any) -> Optional[T]:
+        """Build a model from a cached value produced by encode_model
+        
+        Returns None for entries that no longer match the model's cache layout
+        (legacy JSON or a changed __cache_fields__), so callers reload and rewrite them.
+        """
+        fields = getattr(model_cls, "__cache_fields__", None)
+        if isinstance(raw, str) and raw.startswith(MODEL_CACHE_VERSION):
+            values = json_loads(raw[len(MODEL_CACHE_VERSION):])
+            if fields is None or len(values) != len(fields):
+                return None
+            return cls._dict_to_model(model_cls, dict(zip(fields, values)))
+        
+        if fields is not None:
+            return None
+        
+        if isinstance(raw, str) and hasattr(model_cls, "model_validate_json"):
+            return model_cls.model_validate_json(raw)
+        
+        data = json_loads(raw) if isinstance(raw, str) else raw
+        if isinstance(data, model_cls):
+            return data
+        return cls._dict_to_model(model_cls, data)
+    
+    @staticmethod
+    def _model_to_dict(model: Any) -> Dict[str, Any]:
+        """Convert a pydantic or SQLAlchemy model into a JSON-serializable dict"""
+        if isinstance(model, BaseModel):
+            return model.model_dump(mode="json")
+        
+        data = {}
+        for column in model.__table__.columns:
+            value = getattr(model, column.key)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            data[column.key] = value
+        return data
+    
+    @staticmethod
+    def _dict_to_model(model_cls: Type[T], data: Dict[str, Any]) -> T:
+        """Build a pydantic or SQLAlchemy model from a cached dict"""
+        if hasattr(model_cls, "model_validate"):
+            return model_cls.model_validate(data)
+        
+        data = dict(data)
+        for column in model_cls.__table__.columns:
+            value = data.get(column.key)
+            if isinstance(value, str) and isinstance(column.type, DateTime):
+                data[column.key] = datetime.fromisoformat(value)
+        return model_cls(**data)
+    
     async def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
         """Set a value in cache
         
@@ -156,11 +451,7 @@ class CacheService:
         if not self.connected:
             await self.connect()
         
-        # Convert to JSON string for storage if not a string already
-        if not isinstance(value, (str, int, float, bool)) and value is not None:
-            value_str = json.dumps(value)
-        else:
-            value_str = str(value) if value is not None else None
+        value_str = self._serialize(value)
         
         # Store in Redis
         if self.client:
@@ -180,13 +471,60 @@ class CacheService:
         
         # Set expiration
         if ttl:
-            self.in_memory_ttl[key] = datetime.now() + timedelta(seconds=ttl)
+            self._set_in_memory_ttl(key, ttl)
         elif key in self.in_memory_ttl:
             # Remove TTL if exists but not provided
             del self.in_memory_ttl[key]
         
         return True
     
+    @staticmethod
+    def _serialize(value: Any) -> Optional[str]:
+        """Convert a value to the string stored in Redis"""
+        # Convert to JSON string for storage if not a string already
+        if not isinstance(value, (str, int, float, bool)) and value is not None:
+            return json_dumps(value)
+        return str(value) if value is not None else None
+    
+    async def set_many(
+        self,
+        items: List[Tuple[str, Any, Optional[int]]],
+        delete: Sequence[str] = ()
+    ) -> bool:
+        """Set several values and delete keys in one round-trip
+        
+        Args:
+            items: (key, value, ttl) tuples, as for set()
+            delete: Keys to delete
+        """
+        if not self.connected:
+            await self.connect()
+        
+        # Send everything to Redis in one non-transactional pipeline
+        if self.client:
+            try:
+                async with self.client.pipeline(transaction=False) as pipe:
+                    if delete:
+                        pipe.delete(*delete)
+                    for key, value, ttl in items:
+                        if ttl:
+                            pipe.setex(key, ttl, self._serialize(value))
+                        else:
+                            pipe.set(key, self._serialize(value))
+                    await pipe.execute()
+                return True
+                
+            except Exception as e:
+                logger.error(f"Error writing {len(items)} keys to Redis: {e}")
+                return False
+        
+        # Apply to in-memory cache
+        for key in delete:
+            await self.delete(key)
+        for key, value, ttl in items:
+            await self.set(key, value, ttl=ttl)
+        return True
+    
     async def delete(self, key: str) -> bool:
         """Delete a key from cache"""
         if not self.connected:
@@ -227,9 +565,148 @@ class CacheService:
         # Check in in-memory cache
         return key in self.in_memory_cache and (
             key not in self.in_memory_ttl or
-            self.in_memory_ttl[key] >= datetime.now()
+            self.in_memory_ttl[key] >= time.monotonic()
         )
     
+    async def eval_script(self, script: str, keys: List[str], args: List[Any]) -> Any:
+        """Run a Lua script on Redis
+        
+        The script is registered once and then invoked by SHA (EVALSHA).
+        Returns None when Redis is not available.
+        """
+        if not self.client:
+            return None
+        
+        registered = self._scripts.get(script)
+        if registered is None:
+            registered = self._scripts[script] = self.client.register_script(script)
+        
+        try:
+            return await registered(keys=keys, args=args)
+            
+        except Exception as e:
+            logger.error(f"Error running script on keys {keys} in Redis: {e}")
+            return None
+    
+    async def incr(self, key: str, ttl: Optional[int] = None) -> Optional[int]:
+        """Atomically increment a counter
+        
+        Args:
+            key: Cache key
+            ttl: Time-to-live in seconds, applied when the counter is created
+        """
+        if ttl:
+            count, _ = await self.incr_with_ttl(key, ttl)
+            return count
+        
+        if not self.connected:
+            await self.connect()
+        
+        # Increment in Redis
+        if self.client:
+            try:
+                return await self.client.incr(key)
+                
+            except Exception as e:
+                logger.error(f"Error incrementing key '{key}' in Redis: {e}")
+                return None
+        
+        # Increment in in-memory cache (get() drops the key if it has expired)
+        count = (await self.get(key) or 0) + 1
+        self.in_memory_cache[key] = count
+        return count
+    
+    async def incr_with_ttl(self, key: str, ttl: int) -> Tuple[Optional[int], Optional[int]]:
+        """Atomically increment an expiring counter and get its remaining TTL
+        
+        Args:
+            key: Cache key
+            ttl: Time-to-live in seconds, applied when the counter is created
+            
+        Returns:
+            (count, remaining seconds) - either may be None if unavailable
+        """
+        if not self.connected:
+            await self.connect()
+        
+        # Increment in Redis
+        if self.client:
+            result = await self.eval_script(self.INCR_EXPIRE_SCRIPT, keys=[key], args=[ttl])
+            if not result:
+                return None, None
+            count, remaining = result
+            return count, remaining if remaining > 0 else None
+        
+        # Increment in in-memory cache (get() drops the key if it has expired)
+        count = (await self.get(key) or 0) + 1
+        self.in_memory_cache[key] = count
+        if count == 1:
+            self._set_in_memory_ttl(key, ttl)
+        
+        return count, await self.get_ttl(key)
+    
+    async def hit_sliding_window(self, key: str, period: int) -> Tuple[Optional[int], Optional[int]]:
+        """Record a hit in a sliding window and count the hits inside it
+        
+        Args:
+            key: Cache key
+            period: Window length in seconds
+            
+        Returns:
+            (hits in the window, seconds until the oldest hit expires) - either may be None if unavailable
+        """
+        if not self.connected:
+            await self.connect()
+        
+        # Record in Redis
+        if self.client:
+            now_ms = int(time.time() * 1000)
+            result = await self.eval_script(
+                self.SLIDING_WINDOW_SCRIPT,
+                keys=[key],
+                args=[now_ms, period * 1000, f"{now_ms}:{uuid.uuid4().hex}"]
+            )
+            if not result:
+                return None, None
+            count, remaining_ms = result
+            return count, math.ceil(remaining_ms / 1000)
+        
+        # Record in memory, trimming only the window being touched
+        now = time.monotonic()
+        cutoff = now - period
+        hits = self._windows.get(key)
+        if hits is None:
+            hits = deque()
+        while hits and hits[0] <= cutoff:
+            hits.popleft()
+        hits.append(now)
+        self._windows[key] = hits  # also marks the key as recently used
+        
+        return len(hits), math.ceil(hits[0] + period - now)
+    
+    async def keys(self, pattern: str) -> List[str]:
+        """Get keys matching a glob-style pattern
+        
+        Uses SCAN on Redis so the server is never blocked by a full KEYS walk.
+        """
+        if not self.connected:
+            return []
+        
+        # Scan Redis in batches
+        if self.client:
+            try:
+                result = []
+                async for key in self.client.scan_iter(match=pattern, count=500):
+                    result.append(key)
+                return result
+                
+            except Exception as e:
+                logger.error(f"Error scanning keys '{pattern}' in Redis: {e}")
+                return []
+        
+        # Match against in-memory cache
+        return [key for key in self.in_memory_cache if fnmatch.fnmatchcase(key, pattern)]
+    
     async def get_ttl(self, key: str) -> Optional[int]:
         """Get TTL for a key in seconds"""
         if not self.connected:
@@ -247,7 +724,7 @@ class CacheService:
         
         # Get from in-memory cache
         if key in self.in_memory_ttl:
-            remaining = (self.in_memory_ttl[key] - datetime.now()).total_seconds()
+            remaining = self.in_memory_ttl[key] - time.monotonic()
             return int(remaining) if remaining > 0 else None
         
         return None
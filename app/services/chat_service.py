@@ -1,60 +1,215 @@
-from typing import Dict, List, Any, Optional, Union
+from typing import AsyncIterator, Dict, List, Any, Optional, Union
 from loguru import logger
 from datetime import datetime
 import asyncio
-from sqlalchemy import select
+import time
+from contextlib import asynccontextmanager
+from sqlalchemy import select, update, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database.session import get_session
+from app.services.cache_service import cache_service, LRUCache
 from app.models.chat import Chat, ChatMember, ChatMemberStatus
 from app.models.user import User
 
 
+@asynccontextmanager
+async def _use_session(session: Optional[AsyncSession] = None) -> AsyncIterator[AsyncSession]:
+    """Reuse the caller's session, or open a new one for the duration of the call"""
+    if session is not None:
+        yield session
+    else:
+        async with get_session() as new_session:
+            yield new_session
+
+
 class ChatService:
     """Service for managing chats and chat members"""
     
-    async def get_chat_by_telegram_id(self, telegram_id: int) -> Optional[Chat]:
-        """Get a chat by its Telegram ID"""
+    # Telegram member statuses are cached briefly to avoid a getChatMember call per message
+    MEMBER_STATUS_TTL = 45
+    
+    @staticmethod
+    def member_status_key(chat_telegram_id: int, user_telegram_id: int) -> str:
+        """Cache key for a user's Telegram status in a chat"""
+        return f"chat_member:status:{chat_telegram_id}:{user_telegram_id}"
+    
+    async def get_cached_member_status(self, chat_telegram_id: int, user_telegram_id: int) -> Optional[str]:
+        """Get a user's cached Telegram status in a chat"""
+        return await cache_service.get(self.member_status_key(chat_telegram_id, user_telegram_id))
+    
+    async def cache_member_status(self, chat_telegram_id: int, user_telegram_id: int, status: str) -> None:
+        """Cache a user's Telegram status in a chat"""
+        await cache_service.set(
+            self.member_status_key(chat_telegram_id, user_telegram_id), status, ttl=self.MEMBER_STATUS_TTL
+        )
+    
+    async def invalidate_member_status(self, chat_telegram_id: int, user_telegram_id: int) -> None:
+        """Drop a user's cached Telegram status in a chat"""
+        await cache_service.delete(self.member_status_key(chat_telegram_id, user_telegram_id))
+    
+    # Per-chat texts, by the key used in commands -> Chat column
+    CHAT_TEXT_COLUMNS = {
+        "welcome": "welcome_message",
+        "goodbye": "goodbye_message",
+        "rules": "rules",
+    }
+    CHAT_TEXT_TTL = 3600
+    # Texts are also kept in process briefly, so join storms don't even reach Redis
+    LOCAL_CHAT_TEXT_TTL = 60
+    
+    def __init__(self):
+        """Initialize the service"""
+        # "<chat telegram id>:<key>" -> (expires at, text or None)
+        self._chat_texts = LRUCache(max_size=10000)
+        # (chat telegram id, title) -> database ID; a renamed chat misses and is written once
+        self._chat_ids = LRUCache(max_size=10000)
+    
+    async def get_chat_text(self, chat_telegram_id: int, key: str) -> Optional[str]:
+        """Get a chat's welcome, goodbye or rules text
+        
+        Served from process memory, then Redis, then the chats table.
+        """
+        local_key = f"{chat_telegram_id}:{key}"
+        now = time.monotonic()
+        entry = self._chat_texts.get(local_key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        
+        # Cached as {"text": ...} so texts that look like JSON scalars survive the round trip
+        cache_key = f"chat:text:{local_key}"
+        cached = await cache_service.get(cache_key)
+        if isinstance(cached, dict):
+            text = cached.get("text")
+        else:
+            column = getattr(Chat, self.CHAT_TEXT_COLUMNS[key])
+            async with get_session() as session:
+                result = await session.execute(select(column).where(Chat.telegram_id == chat_telegram_id))
+                text = result.scalar_one_or_none()
+            await cache_service.set(cache_key, {"text": text}, ttl=self.CHAT_TEXT_TTL)
+        
+        self._chat_texts[local_key] = (now + self.LOCAL_CHAT_TEXT_TTL, text)
+        return text
+    
+    async def set_chat_text(self, chat_telegram_id: int, key: str, text: Optional[str]) -> bool:
+        """Save a chat's welcome, goodbye or rules text, writing through to the cache
+        
+        Returns False if the chat is not known.
+        """
+        column = self.CHAT_TEXT_COLUMNS[key]
         async with get_session() as session:
+            result = await session.execute(
+                update(Chat)
+                .where(Chat.telegram_id == chat_telegram_id)
+                .values({column: text, "updated_at": func.now()})
+                .returning(Chat.id)
+            )
+            found = result.scalar_one_or_none() is not None
+            await session.commit()
+        
+        if found:
+            local_key = f"{chat_telegram_id}:{key}"
+            await cache_service.set(f"chat:text:{local_key}", {"text": text}, ttl=self.CHAT_TEXT_TTL)
+            self._chat_texts[local_key] = (time.monotonic() + self.LOCAL_CHAT_TEXT_TTL, text)
+        return found
+    
+    async def get_chat_by_telegram_id(
+        self,
+        telegram_id: int,
+        session: Optional[AsyncSession] = None
+    ) -> Optional[Chat]:
+        """Get a chat by its Telegram ID"""
+        async with _use_session(session) as session:
             query = select(Chat).where(Chat.telegram_id == telegram_id)
             result = await session.execute(query)
             return result.scalars().first()
     
+    async def chat_id_by_telegram_id(
+        self,
+        telegram_id: int,
+        session: Optional[AsyncSession] = None
+    ) -> Optional[int]:
+        """Get the database ID of a chat without loading the full row"""
+        async with _use_session(session) as session:
+            query = select(Chat.id).where(Chat.telegram_id == telegram_id)
+            result = await session.execute(query)
+            return result.scalar_one_or_none()
+    
+    async def get_or_create_chat_id(
+        self,
+        telegram_id: int,
+        title: str,
+        chat_type: str,
+        session: Optional[AsyncSession] = None
+    ) -> int:
+        """Get or create a chat and return only its database ID
+        
+        Known chats with an unchanged title are resolved from process memory,
+        then from the (id, title) columns alone; the full row is only written
+        and loaded on create or when the title has changed.
+        """
+        cache_key = (telegram_id, title)
+        chat_id = self._chat_ids.get(cache_key)
+        if chat_id is not None:
+            return chat_id
+        
+        async with _use_session(session) as session:
+            query = select(Chat.id, Chat.title).where(Chat.telegram_id == telegram_id)
+            result = await session.execute(query)
+            row = result.first()
+            
+            if row is not None and row.title == title:
+                chat_id = row.id
+            else:
+                chat = await self.get_or_create_chat(telegram_id, title, chat_type, session=session)
+                chat_id = chat.id
+        
+        self._chat_ids[cache_key] = chat_id
+        return chat_id
+    
     async def get_or_create_chat(
         self,
         telegram_id: int,
         title: str,
         chat_type: str,
+        session: Optional[AsyncSession] = None
     ) -> Chat:
-        """Get or create a chat by its Telegram ID"""
-        # First try to get the chat
-        chat = await self.get_chat_by_telegram_id(telegram_id)
-        
-        # If chat doesn't exist, create it
-        if not chat:
-            async with get_session() as session:
-                chat = Chat(
-                    telegram_id=telegram_id,
-                    title=title,
-                    chat_type=chat_type,
-                    is_active=True,
-                    created_at=datetime.now(),
-                    updated_at=datetime.now()
-                )
-                session.add(chat)
-                await session.commit()
-                await session.refresh(chat)
-                logger.info(f"Created new chat: {title} (ID: {telegram_id})")
-        else:
-            # Update chat if title has changed
-            if chat.title != title:
-                await self.update_chat(chat.id, {"title": title})
+        """Get or create a chat by its Telegram ID
         
-        return chat
+        Runs as a single INSERT ... ON CONFLICT DO UPDATE ... RETURNING statement.
+        """
+        async with _use_session(session) as session:
+            # Both supported backends (PostgreSQL, SQLite) implement ON CONFLICT
+            insert = sqlite_insert if session.bind.dialect.name == "sqlite" else pg_insert
+            
+            stmt = insert(Chat).values(
+                telegram_id=telegram_id,
+                title=title,
+                chat_type=chat_type,
+                is_active=True
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Chat.telegram_id],
+                set_={"title": stmt.excluded.title, "updated_at": func.now()}
+            ).returning(Chat)
+            
+            result = await session.execute(stmt, execution_options={"populate_existing": True})
+            chat = result.scalars().one()
+            await session.commit()
+            
+            logger.debug(f"Upserted chat: {title} (ID: {telegram_id})")
+            return chat
     
-    async def update_chat(self, chat_id: int, data: Dict[str, Any]) -> bool:
+    async def update_chat(
+        self,
+        chat_id: int,
+        data: Dict[str, Any],
+        session: Optional[AsyncSession] = None
+    ) -> bool:
         """Update chat data"""
-        async with get_session() as session:
+        async with _use_session(session) as session:
             query = select(Chat).where(Chat.id == chat_id)
             result = await session.execute(query)
             chat = result.scalars().first()
@@ -71,9 +226,14 @@ class ChatService:
             await session.commit()
             return True
     
-    async def get_chat_member(self, chat_id: int, user_id: int) -> Optional[ChatMember]:
+    async def get_chat_member(
+        self,
+        chat_id: int,
+        user_id: int,
+        session: Optional[AsyncSession] = None
+    ) -> Optional[ChatMember]:
         """Get chat member"""
-        async with get_session() as session:
+        async with _use_session(session) as session:
             query = select(ChatMember).where(
                 ChatMember.chat_id == chat_id,
                 ChatMember.user_id == user_id
@@ -85,13 +245,14 @@ class ChatService:
         self,
         chat_id: int,
         user_id: int,
-        status: str
+        status: str,
+        session: Optional[AsyncSession] = None
     ) -> ChatMember:
         """Update or create chat member"""
-        # First try to get the chat member
-        chat_member = await self.get_chat_member(chat_id, user_id)
-        
-        async with get_session() as session:
+        async with _use_session(session) as session:
+            # Look up and write back within the same transaction
+            chat_member = await self.get_chat_member(chat_id, user_id, session=session)
+            
             if not chat_member:
                 # Create new chat member record
                 chat_member = ChatMember(
@@ -129,6 +290,13 @@ class ChatService:
             result = await session.execute(query)
             return list(result.scalars().all())
     
+    async def list_active_chat_telegram_ids(self) -> List[int]:
+        """List the Telegram IDs of all active chats"""
+        async with get_session() as session:
+            query = select(Chat.telegram_id).where(Chat.is_active == True)
+            result = await session.execute(query)
+            return list(result.scalars().all())
+    
     async def get_admin_chat_members(self, chat_id: int) -> List[ChatMember]:
         """Get all admin members of a chat"""
         async with get_session() as session:
@@ -1,24 +1,25 @@
 import re
-from typing import Dict, List, Optional, Tuple, Set, Any
-from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple, Set, Any, Deque
 from loguru import logger
 import asyncio
 import time
-from dataclasses import dataclass, field
+from collections import deque
 
 from app.events.event_manager import event_manager
 from app.services.cache_service import cache_service
 from app.models.chat import Chat
 from app.config.settings import settings
 
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+def _stats_key(chat_id: int, user_id: int) -> int:
+    """Pack (chat_id, user_id) into a single int key (one hash per lookup)"""
+    return (chat_id & 0xFFFFFFFFFFFF) << 64 | (user_id & 0xFFFFFFFFFFFFFFFF)
 
-@dataclass
-class UserMessageStats:
-    """User message statistics for flood detection"""
-    messages: List[float] = field(default_factory=list)
-    last_message_time: Optional[float] = None
-    warning_count: int = 0
-    
 
 class ModerationService:
     """Service for chat moderation, spam detection, and anti-flood"""
@@ -37,9 +38,38 @@ class ModerationService:
             # Add more patterns as needed
         ]
         
-        # Flood prevention
-        self.user_message_stats: Dict[Tuple[int, int], UserMessageStats] = {}  # (chat_id, user_id) -> stats
+        # Single alternation so one scan finds the first matching pattern;
+        # the named group p<i> identifies which entry of spam_patterns matched
+        self.combined_spam_pattern = re.compile(
+            "|".join(f"(?P<p{i}>{pattern.pattern})" for i, pattern in enumerate(self.spam_patterns)),
+            re.IGNORECASE
+        )
+        
+        # Literal substrings (casefolded) that every spam pattern needs in order to match;
+        # the regex only runs when at least one of them is present
+        self.spam_literals = ("followers", "make money online", "earn $", "join my channel", "click here")
+        self._spam_literal_automaton = None
+        if ahocorasick is not None:
+            self._spam_literal_automaton = ahocorasick.Automaton()
+            for literal in self.spam_literals:
+                self._spam_literal_automaton.add_word(literal, literal)
+            self._spam_literal_automaton.make_automaton()
+        
+        # Flood prevention, stored as parallel maps keyed by _stats_key(chat_id, user_id)
+        self.flood_messages: Dict[int, Deque[float]] = {}  # recent message timestamps
+        self.last_message_times: Dict[int, float] = {}
+        self.flood_warning_counts: Dict[int, int] = {}
+        self.flood_history_size = 256  # max timestamps kept per user
         self.flood_expiry_time = 60  # seconds to keep message history
+        
+        # Short-lived in-process copy of chat settings: chat_id -> (expires_at, settings)
+        self._settings_cache: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+        self.settings_cache_ttl = 2.0  # seconds
+        
+        # Detection events are buffered and published together every event_flush_interval
+        self._event_buffer: List[Tuple[str, Dict[str, Any]]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self.event_flush_interval = 0.05  # seconds
     
     async def check_message(self, chat_id: int, user_id: int, message_text: str, message_id: int) -> Dict[str, Any]:
         """
@@ -71,12 +101,12 @@ class ModerationService:
                 result['should_warn'] = True
                 
                 # Publish spam detection event
-                await event_manager.publish("spam:detected", {
+                self._queue_event("spam:detected", {
                     "chat_id": chat_id,
                     "user_id": user_id,
                     "message_id": message_id,
                     "spam_type": spam_check['spam_type'],
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": time.time()
                 })
                 
                 return result
@@ -91,19 +121,45 @@ class ModerationService:
                 result['should_warn'] = flood_check['warning_count'] % 3 == 0  # Warn every 3 flood messages
                 
                 # Publish flood detection event
-                await event_manager.publish("flood:detected", {
+                self._queue_event("flood:detected", {
                     "chat_id": chat_id,
                     "user_id": user_id,
                     "message_id": message_id,
                     "messages_per_second": flood_check.get('messages_per_second', 0),
                     "warning_count": flood_check.get('warning_count', 0),
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": time.time()
                 })
                 
                 return result
         
         return result
     
+    def _queue_event(self, event_type: str, data: Dict[str, Any]) -> None:
+        """Buffer an event and make sure a flush is scheduled"""
+        self._event_buffer.append((event_type, data))
+        
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_events())
+    
+    async def _flush_events(self) -> None:
+        """Publish buffered events as one batch after a short delay"""
+        await asyncio.sleep(self.event_flush_interval)
+        
+        # Swap the buffer so events queued during publishing go to the next batch
+        events, self._event_buffer = self._event_buffer, []
+        try:
+            await event_manager.publish_batch(events)
+        except Exception as e:
+            logger.error(f"Error publishing moderation events: {e}")
+    
+    def _has_spam_literal(self, message_text: str) -> bool:
+        """Fast prefilter: does the text contain any literal a spam pattern requires?"""
+        # casefold() mirrors the case-insensitive matching of the patterns
+        text = message_text.casefold()
+        if self._spam_literal_automaton is not None:
+            return next(self._spam_literal_automaton.iter(text), None) is not None
+        return any(literal in text for literal in self.spam_literals)
+    
     async def _check_spam(self, message_text: str) -> Dict[str, Any]:
         """Check if a message contains spam"""
         result = {
@@ -112,16 +168,21 @@ class ModerationService:
             "reason": None
         }
         
-        # Check against spam patterns
-        for pattern in self.spam_patterns:
-            if pattern.search(message_text):
-                result['is_spam'] = True
-                result['spam_type'] = 'pattern'
-                result['reason'] = f"Matched spam pattern: {pattern.pattern}"
-                return result
+        # Check against spam patterns, skipping the regex when no required literal is present
+        match = None
+        if self._has_spam_literal(message_text):
+            match = self.combined_spam_pattern.search(message_text)
+        if match:
+            pattern = self.spam_patterns[int(match.lastgroup[1:])]
+            result['is_spam'] = True
+            result['spam_type'] = 'pattern'
+            result['reason'] = f"Matched spam pattern: {pattern.pattern}"
+            return result
         
         # Check for excessive URLs
-        urls = self.url_pattern.findall(message_text)
+        urls = ()
+        if "http" in message_text or "www." in message_text:
+            urls = self.url_pattern.findall(message_text)
         if len(urls) > 3:  # More than 3 URLs is suspicious
             result['is_spam'] = True
             result['spam_type'] = 'excessive_urls'
@@ -130,7 +191,8 @@ class ModerationService:
         
         # Check for caps
         if len(message_text) > 15:  # Only check longer messages
-            caps_ratio = sum(1 for c in message_text if c.isupper()) / len(message_text)
+            # map() keeps the per-character isupper() calls in C (no generator frames)
+            caps_ratio = sum(map(str.isupper, message_text)) / len(message_text)
             if caps_ratio > 0.7:  # 70% or more uppercase
                 result['is_spam'] = True
                 result['spam_type'] = 'excessive_caps'
@@ -148,43 +210,63 @@ class ModerationService:
             "warning_count": 0
         }
         
-        key = (chat_id, user_id)
+        key = _stats_key(chat_id, user_id)
         current_time = time.time()
         
-        # Initialize user stats if not exists
-        if key not in self.user_message_stats:
-            self.user_message_stats[key] = UserMessageStats()
+        # Initialize user history if not exists
+        messages = self.flood_messages.get(key)
+        if messages is None:
+            messages = self.flood_messages[key] = deque(maxlen=self.flood_history_size)
         
-        user_stats = self.user_message_stats[key]
-        user_stats.last_message_time = current_time
-        user_stats.messages.append(current_time)
+        self.last_message_times[key] = current_time
+        messages.append(current_time)
         
         # Clean old messages (older than flood_expiry_time)
-        user_stats.messages = [
-            t for t in user_stats.messages 
-            if current_time - t < self.flood_expiry_time
-        ]
+        while messages and current_time - messages[0] >= self.flood_expiry_time:
+            messages.popleft()
+        
+        # Count messages in the last 3 seconds, walking back from the newest
+        recent_count = 0
+        oldest_recent = current_time
+        for t in reversed(messages):
+            if current_time - t > 3:
+                break
+            recent_count += 1
+            oldest_recent = t
         
         # Calculate messages per second in last 3 seconds
-        recent_messages = [
-            t for t in user_stats.messages 
-            if current_time - t <= 3
-        ]
-        if len(recent_messages) >= threshold:
-            seconds = max(1, current_time - min(recent_messages))
-            msgs_per_second = len(recent_messages) / seconds
+        if recent_count >= threshold:
+            seconds = max(1, current_time - oldest_recent)
+            msgs_per_second = recent_count / seconds
             
             if msgs_per_second >= threshold:
-                user_stats.warning_count += 1
+                warning_count = self.flood_warning_counts.get(key, 0) + 1
+                self.flood_warning_counts[key] = warning_count
                 result['is_flood'] = True
                 result['messages_per_second'] = msgs_per_second
                 result['reason'] = f"Sending too many messages ({msgs_per_second:.1f}/second)"
-                result['warning_count'] = user_stats.warning_count
+                result['warning_count'] = warning_count
         
         return result
     
     async def _get_chat_settings(self, chat_id: int) -> Dict[str, Any]:
-        """Get chat moderation settings from cache or database"""
+        """Get chat moderation settings from memory, cache or database"""
+        # Serve recent settings from process memory without a cache round-trip
+        now = time.monotonic()
+        cached = self._settings_cache.get(chat_id)
+        if cached and cached[0] > now:
+            return cached[1]
+        
+        settings = await self._load_chat_settings(chat_id)
+        self._settings_cache[chat_id] = (now + self.settings_cache_ttl, settings)
+        return settings
+    
+    def invalidate_chat_settings(self, chat_id: int) -> None:
+        """Drop the in-process copy of a chat's settings (call after changing them)"""
+        self._settings_cache.pop(chat_id, None)
+    
+    async def _load_chat_settings(self, chat_id: int) -> Dict[str, Any]:
+        """Load chat moderation settings from cache or database"""
         # Try to get from cache first
         cache_key = f"chat:settings:{chat_id}"
         settings = await cache_service.get_json(cache_key)
@@ -213,18 +295,23 @@ class ModerationService:
         """Clean expired user message stats (periodic task)"""
         current_time = time.time()
         
-        # Find keys to remove
-        to_remove = []
-        for key, stats in self.user_message_stats.items():
-            if stats.last_message_time and current_time - stats.last_message_time > self.flood_expiry_time:
-                to_remove.append(key)
+        # Remove expired stats in a single pass
+        last_times = self.last_message_times
+        removed = 0
+        for key in list(last_times):
+            if current_time - last_times[key] > self.flood_expiry_time:
+                last_times.pop(key, None)
+                self.flood_messages.pop(key, None)
+                self.flood_warning_counts.pop(key, None)
+                removed += 1
         
-        # Remove expired stats
-        for key in to_remove:
-            del self.user_message_stats[key]
+        # Drop expired in-process settings copies
+        now = time.monotonic()
+        for chat_id in [c for c, (expires_at, _) in self._settings_cache.items() if expires_at <= now]:
+            del self._settings_cache[chat_id]
         
-        if to_remove:
-            logger.debug(f"Cleaned {len(to_remove)} expired user message stats")
+        if removed:
+            logger.debug(f"Cleaned {removed} expired user message stats")
 
 
 # Create singleton instance
@@ -23,64 +23,55 @@ class RateLimitService:
         Returns:
             bool: True if rate limit is exceeded, False otherwise
         """
-        # Get current timestamp
-        now = time.time()
+        is_limited, _ = await self.check_rate_limit_with_cooldown(key, limit, period)
+        return is_limited
+    
+    async def check_rate_limit_with_cooldown(self, key: str, limit: int, period: int) -> Tuple[bool, int]:
+        """
+        Check a rate limit and get the remaining cooldown in the same cache round-trip
         
-        # Get the current count and window start time from cache
+        Args:
+            key: Unique identifier for this rate limit (usually contains user ID and action)
+            limit: Maximum number of requests allowed in the period
+            period: Time period in seconds
+            
+        Returns:
+            Tuple[bool, int]: Whether the limit is exceeded, and seconds until the window resets
+        """
+        # Count this request; the window starts (and expires) with the first one
         cache_key = f"ratelimit:{key}"
-        rate_data = await cache_service.get(cache_key)
+        count, remaining = await cache_service.incr_with_ttl(cache_key, ttl=period)
         
-        if rate_data is None:
-            # First request in this window
-            rate_data = {
-                "count": 1,
-                "window_start": now,
-                "last_request": now
-            }
-            
-            # Store in cache
-            await cache_service.set(
-                key=cache_key,
-                value=rate_data,
-                ttl=period
-            )
-            
-            # Not limited
-            return False
+        if count is None:
+            # Cache unavailable, don't block the request
+            return False, 0
         
-        # Check if we're in a new window
-        window_elapsed = now - rate_data["window_start"]
-        if window_elapsed > period:
-            # Start a new window
-            rate_data = {
-                "count": 1,
-                "window_start": now,
-                "last_request": now
-            }
-            
-            # Store in cache
-            await cache_service.set(
-                key=cache_key,
-                value=rate_data,
-                ttl=period
-            )
-            
-            # Not limited
-            return False
+        # Check if we've exceeded the limit
+        return count > limit, remaining or 0
+    
+    async def check_sliding_window(self, key: str, limit: int, period: int) -> Tuple[bool, int]:
+        """
+        Check a rate limit over a sliding window
         
-        # We're in the same window, increment the counter
-        rate_data["count"] += 1
-        rate_data["last_request"] = now
+        Unlike the fixed window of check_rate_limit, a burst straddling a window
+        boundary can't get through twice the limit. Rejected requests are recorded too.
         
-        # Store updated data
-        await cache_service.set(
-            key=cache_key,
-            value=rate_data,
-            ttl=period
-        )
+        Args:
+            key: Unique identifier for this rate limit (usually contains user ID and action)
+            limit: Maximum number of requests allowed in any period
+            period: Window length in seconds
+            
+        Returns:
+            Tuple[bool, int]: Whether the limit is exceeded, and seconds until the oldest request leaves the window
+        """
+        cache_key = f"ratelimit:window:{key}"
+        count, remaining = await cache_service.hit_sliding_window(cache_key, period)
         
-        # Check if we've exceeded the limit
-        return rate_data["count"] > limit
+        if count is None:
+            # Cache unavailable, don't block the request
+            return False, 0
+        
+        return count > limit, remaining or 0
     
     async def get_cooldown(self, key: str) -> int:
         """
@@ -92,23 +83,11 @@ class RateLimitService:
         Returns:
             int: Seconds remaining in the cooldown period, or 0 if no cooldown
         """
-        # Get rate limit data from cache
+        # The window ends when the counter key expires
         cache_key = f"ratelimit:{key}"
-        rate_data = await cache_service.get(cache_key)
-        
-        if not rate_data:
-            return 0
-        
-        # Calculate cooldown based on the window start time and period
-        now = time.time()
-        window_start = rate_data.get("window_start", now)
-        period = await cache_service.get_ttl(cache_key)
-        
-        # Calculate time remaining in the window
-        elapsed = now - window_start
-        remaining = max(0, math.ceil(period - elapsed))
+        remaining = await cache_service.get_ttl(cache_key)
         
-        return remaining
+        return remaining or 0
     
     async def reset_rate_limit(self, key: str) -> bool:
         """
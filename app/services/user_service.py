@@ -1,40 +1,121 @@
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Union, Set, NamedTuple
 from datetime import datetime
-from sqlalchemy import select, update, delete
+from contextlib import nullcontext
+import asyncio
+from sqlalchemy import select, update, delete, func, bindparam, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
 from loguru import logger
 
-from app.models.base import get_db_session
+from app.models.base import get_db_session, engine
 from app.models.user import User, UserRole
 from app.models.chat import Chat, ChatMember, ChatMemberStatus
 from app.services.cache_service import cache_service
 from app.events.event_manager import event_manager
+from app.utils.helpers import Clock
+
+
+# Strong references to pending background publishes (the loop only keeps weak ones)
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def _publish_in_background(event_type: str, data: Dict[str, Any]) -> None:
+    """Publish an event without making the caller wait for it"""
+    task = asyncio.create_task(event_manager.publish(event_type, data))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+class AuthUser(NamedTuple):
+    """The few user columns needed for permission checks"""
+    id: int
+    telegram_id: int
+    role: str
+    is_banned: bool
+
+
+# Column-only query for fetch_auth; built once and reused
+_auth_query = select(User.id, User.telegram_id, User.role, User.is_banned).where(
+    User.telegram_id == bindparam("telegram_id")
+)
 
 
 class UserService:
     """Service for managing users"""
     
+    # How long the role-only cache entry used by permission checks lives
+    ROLE_CACHE_TTL = 300
+    
+    # Cached in place of a user that doesn't exist, so unknown IDs don't hit the database
+    # on every message; create_or_update_user overwrites it
+    MISSING_USER = "\x00"
+    MISSING_USER_TTL = 30
+    
+    # In-flight database loads by telegram_id, shared by concurrent cache misses
+    _user_loads: Dict[int, "asyncio.Task[Optional[User]]"] = {}
+    
+    @staticmethod
+    async def cache_user_role(telegram_id: int, role: str) -> None:
+        """Cache just the user's role for the authorization hot path"""
+        await cache_service.set(f"user:role:{telegram_id}", role, ttl=UserService.ROLE_CACHE_TTL)
+    
     @staticmethod
     async def get_user_by_telegram_id(telegram_id: int) -> Optional[User]:
         """Get a user by Telegram ID"""
         # Try to get from cache first
         cache_key = f"user:telegram:{telegram_id}"
-        cached_user = await cache_service.get_model(cache_key, User)
-        if cached_user:
-            return cached_user
+        cached = await cache_service.get(cache_key)
+        if cached == UserService.MISSING_USER:
+            return None
+        if cached is not None:
+            try:
+                cached_user = cache_service.decode_model(User, cached)
+                if cached_user:
+                    return cached_user
+            except Exception as e:
+                logger.error(f"Error loading cached user {telegram_id}: {e}")
+        
+        # If not in cache, get from database - only one load per telegram_id at a time
+        task = UserService._user_loads.get(telegram_id)
+        if task is None:
+            task = asyncio.ensure_future(UserService._load_user(telegram_id, cache_key))
+            UserService._user_loads[telegram_id] = task
+            task.add_done_callback(lambda _: UserService._user_loads.pop(telegram_id, None))
         
-        # If not in cache, get from database
+        # Shield the shared load so one cancelled caller doesn't cancel it for the rest
+        return await asyncio.shield(task)
+    
+    @staticmethod
+    async def _load_user(telegram_id: int, cache_key: str) -> Optional[User]:
+        """Load a user from the database and fill the cache"""
         async with get_db_session() as session:
             query = select(User).where(User.telegram_id == telegram_id)
             result = await session.execute(query)
             user = result.scalars().first()
             
-            # If found, cache for future use
+            # Cache for future use, remembering misses briefly
             if user:
                 await cache_service.set_model(cache_key, user)
+            else:
+                await cache_service.set(cache_key, UserService.MISSING_USER, ttl=UserService.MISSING_USER_TTL)
             
             return user
     
+    @staticmethod
+    async def fetch_auth(telegram_id: int) -> Optional[AuthUser]:
+        """Get the permission-relevant columns of a user
+        
+        Runs a plain column query on a pooled connection, skipping the ORM session
+        and object hydration. Use get_user_by_telegram_id when the full user is needed.
+        """
+        async with engine.connect() as conn:
+            result = await conn.execute(_auth_query, {"telegram_id": telegram_id})
+            row = result.first()
+        
+        return AuthUser(*row) if row else None
+    
     @staticmethod
     async def create_or_update_user(
         telegram_id: int,
@@ -43,120 +124,144 @@ class UserService:
         last_name: Optional[str] = None,
         language_code: Optional[str] = None
     ) -> User:
-        """Create or update a user"""
-        # Try to get existing user
-        user = await UserService.get_user_by_telegram_id(telegram_id)
+        """Create or update a user
         
+        Runs as a single INSERT ... ON CONFLICT DO UPDATE ... RETURNING statement
+        (plus an existence check on SQLite, to tell creation from update);
+        empty values never overwrite stored ones.
+        """
         async with get_db_session() as session:
-            if user:
-                # Update existing user
-                user.username = username or user.username
-                user.first_name = first_name or user.first_name
-                user.last_name = last_name or user.last_name
-                user.language_code = language_code or user.language_code
-                
-                session.add(user)
-                await session.commit()
-                
-                # Update cache
-                cache_key = f"user:telegram:{telegram_id}"
-                await cache_service.set_model(cache_key, user)
-                
-                logger.debug(f"Updated user: {user}")
+            # Both supported backends (PostgreSQL, SQLite) implement ON CONFLICT
+            is_sqlite = session.bind.dialect.name == "sqlite"
+            insert = sqlite_insert if is_sqlite else pg_insert
+            
+            if is_sqlite:
+                # SQLite can't tell whether the upsert inserted, so check for the row first
+                existing = await session.execute(select(User.id).where(User.telegram_id == telegram_id))
+                created = existing.first() is None
+            
+            stmt = insert(User).values(
+                telegram_id=telegram_id,
+                username=username,
+                first_name=first_name,
+                last_name=last_name,
+                language_code=language_code or "en"
+            )
+            excluded = stmt.excluded
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[User.telegram_id],
+                set_={
+                    "username": func.coalesce(func.nullif(excluded.username, ""), User.username),
+                    "first_name": func.coalesce(func.nullif(excluded.first_name, ""), User.first_name),
+                    "last_name": func.coalesce(func.nullif(excluded.last_name, ""), User.last_name),
+                    "language_code": func.coalesce(func.nullif(language_code, ""), User.language_code),
+                    "updated_at": func.now()
+                }
+            )
+            
+            if is_sqlite:
+                stmt = stmt.returning(User)
             else:
-                # Create new user
-                user = User(
-                    telegram_id=telegram_id,
-                    username=username,
-                    first_name=first_name,
-                    last_name=last_name,
-                    language_code=language_code,
-                )
-                
-                session.add(user)
-                await session.commit()
-                
-                # Cache the new user
-                cache_key = f"user:telegram:{telegram_id}"
-                await cache_service.set_model(cache_key, user)
-                
-                logger.info(f"Created new user: {user}")
-                
-                # Publish user created event
-                await event_manager.publish("user:created", {
-                    "user_id": user.id,
-                    "telegram_id": user.telegram_id,
-                    "username": user.username
-                })
+                # xmax is 0 only on a row version this statement inserted
+                stmt = stmt.returning(User, literal_column("(xmax = 0)").label("inserted"))
             
-            return user
+            result = await session.execute(stmt, execution_options={"populate_existing": True})
+            row = result.one()
+            user = row[0]
+            if not is_sqlite:
+                created = row[1]
+            await session.commit()
+        
+        # Cache the stored user
+        await cache_service.set_many([
+            (f"user:telegram:{telegram_id}", cache_service.encode_model(user), None),
+            (f"user:role:{telegram_id}", user.role, UserService.ROLE_CACHE_TTL)
+        ])
+        
+        if created:
+            logger.info(f"Created new user: {user}")
+            
+            # Publish user created event
+            _publish_in_background("user:created", {
+                "user_id": user.id,
+                "telegram_id": user.telegram_id,
+                "username": user.username
+            })
+        else:
+            logger.debug(f"Updated user: {user}")
+        
+        return user
     
     @staticmethod
     async def set_user_role(user_id: int, role: UserRole) -> bool:
         """Set a user's role"""
         async with get_db_session() as session:
-            query = select(User).where(User.id == user_id)
-            result = await session.execute(query)
-            user = result.scalars().first()
+            if session.bind.dialect.name == "sqlite":
+                # SQLite can't return columns of an UPDATE ... FROM subquery, so read the
+                # old role first in the same transaction
+                previous = await session.execute(select(User.role).where(User.id == user_id))
+                prev_role = previous.scalar()
+                stmt = update(User).where(User.id == user_id).values(role=role).returning(User.telegram_id)
+                telegram_id = (await session.execute(stmt)).scalar()
+                row = None if telegram_id is None else (telegram_id, prev_role)
+            else:
+                # Update and read back in one statement; the FROM subquery sees the row as it was
+                previous = select(User.id, User.role.label("previous_role")).where(User.id == user_id).subquery()
+                stmt = (
+                    update(User)
+                    .where(User.id == previous.c.id)
+                    .values(role=role)
+                    .returning(User.telegram_id, previous.c.previous_role)
+                )
+                row = (await session.execute(stmt)).first()
             
-            if not user:
+            if row is None:
                 logger.warning(f"Cannot set role: User {user_id} not found")
                 return False
             
-            prev_role = user.role
-            user.role = role
-            session.add(user)
             await session.commit()
-            
-            # Update cache
-            cache_key = f"user:telegram:{user.telegram_id}"
-            await cache_service.set_model(cache_key, user)
-            
-            # Publish role changed event
-            await event_manager.publish("user:role_changed", {
-                "user_id": user.id,
-                "telegram_id": user.telegram_id,
-                "previous_role": prev_role.value,
-                "new_role": role.value
-            })
-            
-            logger.info(f"Updated user {user.id} role from {prev_role} to {role}")
-            return True
+        
+        telegram_id, prev_role = row
+        
+        # Update cache
+        await cache_service.set_many(
+            [(f"user:role:{telegram_id}", role, UserService.ROLE_CACHE_TTL)],
+            delete=[f"user:telegram:{telegram_id}"]
+        )
+        
+        # Publish role changed event
+        _publish_in_background("user:role_changed", {
+            "user_id": user_id,
+            "telegram_id": telegram_id,
+            "previous_role": prev_role,
+            "new_role": role
+        })
+        
+        logger.info(f"Updated user {user_id} role from {prev_role} to {role}")
+        return True
     
     @staticmethod
     async def ban_user(
         user_id: int,
         reason: Optional[str] = None,
         duration: Optional[int] = None,  # in seconds, None for permanent
-        chat_id: Optional[int] = None  # If set, ban only in this chat
+        chat_id: Optional[int] = None,  # If set, ban only in this chat
+        session: Optional[AsyncSession] = None  # Run inside the caller's session
     ) -> bool:
         """Ban a user globally or in a specific chat"""
-        async with get_db_session() as session:
-            query = select(User).where(User.id == user_id)
-            result = await session.execute(query)
-            user = result.scalars().first()
-            
-            if not user:
-                logger.warning(f"Cannot ban: User {user_id} not found")
-                return False
-            
-            ban_date = datetime.now()
+        async with (nullcontext(session) if session else get_db_session()) as session:
             ban_until = None
             
             if chat_id:
-                # Ban in specific chat
-                chat_query = select(Chat).where(Chat.id == chat_id)
-                chat_result = await session.execute(chat_query)
-                chat = chat_result.scalars().first()
-                
-                if not chat:
-                    logger.warning(f"Cannot ban: Chat {chat_id} not found")
-                    return False
-                
-                # Get the chat member record
-                member_query = select(ChatMember).where(
-                    (ChatMember.user_id == user_id) & 
-                    (ChatMember.chat_id == chat_id)
+                # Ban in specific chat - load the membership with its user in one query
+                # (foreign keys guarantee the user and chat exist if the member does)
+                member_query = (
+                    select(ChatMember)
+                    .options(joinedload(ChatMember.user))
+                    .where(
+                        (ChatMember.user_id == user_id) & 
+                        (ChatMember.chat_id == chat_id)
+                    )
                 )
                 member_result = await session.execute(member_query)
                 member = member_result.scalars().first()
@@ -165,49 +270,65 @@ class UserService:
                     logger.warning(f"Cannot ban: User {user_id} is not a member of chat {chat_id}")
                     return False
                 
+                user = member.user
+                
                 # Update member status
                 member.status = ChatMemberStatus.KICKED
                 member.is_active = False
                 
-                session.add(member)
+                # member is already tracked by this session, so no session.add()
                 await session.commit()
                 
                 # Publish ban event
-                await event_manager.publish("user:banned", {
+                _publish_in_background("user:banned", {
                     "user_id": user.id,
                     "telegram_id": user.telegram_id,
                     "chat_id": chat_id,
                     "reason": reason,
                     "duration": duration,
-                    "ban_date": ban_date.isoformat()
+                    "ban_date": Clock.now_iso()
                 })
                 
                 logger.info(f"Banned user {user.id} from chat {chat_id}: {reason}")
             else:
-                # Global ban
-                user.is_banned = True
-                user.role = UserRole.BANNED
-                user.ban_reason = reason
-                user.ban_date = ban_date
+                # Global ban, updated without loading the user
+                ban_date = datetime.now()
+                stmt = (
+                    update(User)
+                    .where(User.id == user_id)
+                    .values(
+                        is_banned=True,
+                        role=UserRole.BANNED,
+                        ban_reason=reason,
+                        ban_date=ban_date
+                    )
+                    .returning(User.telegram_id)
+                )
+                telegram_id = (await session.execute(stmt)).scalar_one_or_none()
+                
+                if telegram_id is None:
+                    logger.warning(f"Cannot ban: User {user_id} not found")
+                    return False
                 
-                session.add(user)
                 await session.commit()
                 
                 # Update cache
-                cache_key = f"user:telegram:{user.telegram_id}"
-                await cache_service.set_model(cache_key, user)
+                await cache_service.set_many(
+                    [(f"user:role:{telegram_id}", UserRole.BANNED, UserService.ROLE_CACHE_TTL)],
+                    delete=[f"user:telegram:{telegram_id}"]
+                )
                 
                 # Publish ban event
-                await event_manager.publish("user:banned", {
-                    "user_id": user.id,
-                    "telegram_id": user.telegram_id,
+                _publish_in_background("user:banned", {
+                    "user_id": user_id,
+                    "telegram_id": telegram_id,
                     "global": True,
                     "reason": reason,
                     "duration": duration,
-                    "ban_date": ban_date.isoformat()
+                    "ban_date": Clock.now_iso()
                 })
                 
-                logger.info(f"Globally banned user {user.id}: {reason}")
+                logger.info(f"Globally banned user {user_id}: {reason}")
             
             return True
     
@@ -219,67 +340,72 @@ class UserService:
     ) -> Dict[str, Any]:
         """Warn a user in a chat"""
         async with get_db_session() as session:
-            # Get user and chat
-            user_query = select(User).where(User.id == user_id)
-            user_result = await session.execute(user_query)
-            user = user_result.scalars().first()
-            
-            chat_query = select(Chat).where(Chat.id == chat_id)
-            chat_result = await session.execute(chat_query)
-            chat = chat_result.scalars().first()
+            # Get user, chat and membership in one round-trip; the outer join
+            # still tells "not a member" apart from a missing user or chat
+            query = (
+                select(User, Chat, ChatMember)
+                .select_from(User)
+                .join(Chat, Chat.id == chat_id)
+                .outerjoin(
+                    ChatMember,
+                    (ChatMember.user_id == User.id) & (ChatMember.chat_id == Chat.id)
+                )
+                .where(User.id == user_id)
+            )
+            row = (await session.execute(query)).first()
             
-            if not user or not chat:
+            if row is None:
                 logger.warning(f"Cannot warn: User {user_id} or Chat {chat_id} not found")
                 return {"success": False, "message": "User or chat not found"}
             
-            # Get chat member
-            member_query = select(ChatMember).where(
-                (ChatMember.user_id == user_id) & 
-                (ChatMember.chat_id == chat_id)
-            )
-            member_result = await session.execute(member_query)
-            member = member_result.scalars().first()
+            user, chat, member = row
             
             if not member:
                 logger.warning(f"Cannot warn: User {user_id} is not a member of chat {chat_id}")
                 return {"success": False, "message": "User is not a member of the chat"}
             
-            # Increment warnings
-            member.warnings_count += 1
-            session.add(member)
+            # Increment warnings in the database, avoiding a read-modify-write race
+            stmt = (
+                update(ChatMember)
+                .where(ChatMember.id == member.id)
+                .values(warnings_count=ChatMember.warnings_count + 1)
+                .returning(ChatMember.warnings_count)
+            )
+            warnings_count = (await session.execute(stmt)).scalar_one()
             await session.commit()
             
             # Publish warning event
-            await event_manager.publish("user:warned", {
+            _publish_in_background("user:warned", {
                 "user_id": user.id,
                 "telegram_id": user.telegram_id,
                 "chat_id": chat_id,
                 "reason": reason,
-                "warning_count": member.warnings_count
+                "warning_count": warnings_count
             })
             
-            logger.info(f"Warned user {user.id} in chat {chat_id}: {reason} (Count: {member.warnings_count})")
+            logger.info(f"Warned user {user.id} in chat {chat_id}: {reason} (Count: {warnings_count})")
             
             # Check if warning threshold is reached
-            if chat.max_warnings and member.warnings_count >= chat.max_warnings:
+            if chat.max_warnings and warnings_count >= chat.max_warnings:
                 # Ban user from chat
                 await UserService.ban_user(
                     user_id=user_id,
                     chat_id=chat_id,
-                    reason=f"Exceeded maximum warnings ({chat.max_warnings})"
+                    reason=f"Exceeded maximum warnings ({chat.max_warnings})",
+                    session=session
                 )
                 return {
                     "success": True,
-                    "warnings": member.warnings_count,
+                    "warnings": warnings_count,
                     "banned": True,
-                    "message": f"User banned after {member.warnings_count} warnings"
+                    "message": f"User banned after {warnings_count} warnings"
                 }
             
             return {
                 "success": True,
-                "warnings": member.warnings_count,
+                "warnings": warnings_count,
                 "banned": False,
-                "message": f"User warned ({member.warnings_count}/{chat.max_warnings})"
+                "message": f"User warned ({warnings_count}/{chat.max_warnings})"
             }
 
 
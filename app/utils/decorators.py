@@ -1,69 +1,27 @@
 from typing import Callable, Awaitable, Any, List, Union, Dict, Optional
-import functools
-from loguru import logger
-from aiogram import types
-from aiogram.dispatcher.flags import get_flag
 
-from app.config.settings import settings
+
+# These flags are acted on by AuthMiddleware, RateLimitMiddleware and CommandLogMiddleware
+# (app.api.middlewares), once per update, so the decorators below only mark handlers.
+def _set_flags(func: Callable, **flags: Any) -> Callable:
+    """Set aiogram handler flags (read back with aiogram's get_flag)"""
+    func.aiogram_flag = {**getattr(func, 'aiogram_flag', {}), **flags}
+    return func
+
+
+def _set_flag(func: Callable, name: str, value: Any) -> Callable:
+    """Set a single aiogram handler flag"""
+    return _set_flags(func, **{name: value})
 
 
 def admin_required(func: Callable) -> Callable:
-    """Decorator to check if user is an admin"""
-    @functools.wraps(func)
-    async def wrapper(message: types.Message, *args, **kwargs):
-        # Get user data from context (middleware adds this)
-        user_data = kwargs.get('user', {})
-        is_admin = user_data.get('is_admin', False)
-        
-        # Check if user is in the admin IDs list from settings
-        admin_ids = settings.ADMIN_IDS
-        user_id = message.from_user.id if message.from_user else None
-        
-        if is_admin or (user_id and user_id in admin_ids):
-            return await func(message, *args, **kwargs)
-        else:
-            # Not an admin, inform the user
-            await message.reply("❌ This command is only available to administrators.")
-            return None
-    
-    # Mark handler with flag
-    wrapper.flags = getattr(func, 'flags', {})
-    wrapper.flags['admin_required'] = True
-    
-    return wrapper
+    """Decorator to mark a handler as admin-only"""
+    return _set_flag(func, 'admin_required', True)
 
 
 def moderator_required(func: Callable) -> Callable:
-    """Decorator to check if user is a moderator"""
-    @functools.wraps(func)
-    async def wrapper(message: types.Message, *args, **kwargs):
-        # Get user data from context (middleware adds this)
-        user_data = kwargs.get('user', {})
-        is_moderator = user_data.get('is_moderator', False)
-        
-        # Also count admins from settings as moderators
-        admin_ids = settings.ADMIN_IDS
-        user_id = message.from_user.id if message.from_user else None
-        
-        if is_moderator or (user_id and user_id in admin_ids):
-            return await func(message, *args, **kwargs)
-        else:
-            # For group chats, also check if the user is a Telegram admin
-            chat_member_info = kwargs.get('chat_member', {})
-            is_chat_admin = chat_member_info.get('is_admin', False)
-            
-            if is_chat_admin:
-                return await func(message, *args, **kwargs)
-            
-            # Not a moderator, inform the user
-            await message.reply("❌ This command is only available to moderators and administrators.")
-            return None
-    
-    # Mark handler with flag
-    wrapper.flags = getattr(func, 'flags', {})
-    wrapper.flags['moderator_required'] = True
-    
-    return wrapper
+    """Decorator to mark a handler as moderator-only (admins are moderators too)"""
+    return _set_flag(func, 'moderator_required', True)
 
 
 def rate_limit(limit: int) -> Callable:
@@ -73,36 +31,14 @@ def rate_limit(limit: int) -> Callable:
         limit: Maximum number of requests allowed per minute
     """
     def decorator(func: Callable) -> Callable:
-        @functools.wraps(func)
-        async def wrapper(message: types.Message, *args, **kwargs):
-            # The actual rate limiting is handled by RateLimitMiddleware
-            return await func(message, *args, **kwargs)
-        
-        # Mark handler with flag for middleware to use
-        wrapper.flags = getattr(func, 'flags', {})
-        wrapper.flags['rate_limit'] = limit
-        
-        return wrapper
+        return _set_flag(func, 'rate_limit', limit)
     
     return decorator
 
 
 def log_command(func: Callable) -> Callable:
-    """Decorator to log command usage"""
-    @functools.wraps(func)
-    async def wrapper(message: types.Message, *args, **kwargs):
-        # Log command
-        user_id = message.from_user.id if message.from_user else "Unknown"
-        chat_id = message.chat.id if message.chat else "Unknown"
-        chat_type = message.chat.type if message.chat else "Unknown"
-        command = message.text.split()[0] if message.text else "Unknown"
-        
-        logger.info(f"Command {command} used by user {user_id} in chat {chat_id} ({chat_type})")
-        
-        # Call original function
-        return await func(message, *args, **kwargs)
-    
-    return wrapper
+    """Decorator to log command usage (logged by CommandLogMiddleware)"""
+    return _set_flag(func, 'log_command', True)
 
 
 def chat_type(*allowed_types: str) -> Callable:
@@ -113,27 +49,24 @@ def chat_type(*allowed_types: str) -> Callable:
             (e.g. "private", "group", "supergroup")
     """
     def decorator(func: Callable) -> Callable:
-        @functools.wraps(func)
-        async def wrapper(message: types.Message, *args, **kwargs):
-            if not message.chat or message.chat.type not in allowed_types:
-                # Wrong chat type
-                chat_type_str = message.chat.type if message.chat else "Unknown"
-                
-                # Inform user
-                allowed_types_str = ", ".join(allowed_types)
-                await message.reply(
-                    f"❌ This command can only be used in {allowed_types_str} chats.\n"
-                    f"Current chat type: {chat_type_str}"
-                )
-                return None
-            
-            # Correct chat type, proceed
-            return await func(message, *args, **kwargs)
-        
-        # Mark handler with flag
-        wrapper.flags = getattr(func, 'flags', {})
-        wrapper.flags['allowed_chat_types'] = allowed_types
-        
-        return wrapper
+        return _set_flag(func, 'allowed_chat_types', allowed_types)
     
     return decorator
+
+
+GROUP_CHAT_TYPES = ("group", "supergroup")
+
+
+def group_command(func: Callable) -> Callable:
+    """Decorator for a logged, group-only command (log_command + chat_type("group", "supergroup"))"""
+    return _set_flags(func, log_command=True, allowed_chat_types=GROUP_CHAT_TYPES)
+
+
+def moderator_group_command(func: Callable) -> Callable:
+    """Decorator for a logged, group-only, moderator-only command"""
+    return _set_flags(func, moderator_required=True, log_command=True, allowed_chat_types=GROUP_CHAT_TYPES)
+
+
+def admin_group_command(func: Callable) -> Callable:
+    """Decorator for a logged, group-only, admin-only command"""
+    return _set_flags(func, admin_required=True, log_command=True, allowed_chat_types=GROUP_CHAT_TYPES)
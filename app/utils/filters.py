@@ -0,0 +1,20 @@
+from aiogram.filters import BaseFilter
+from aiogram.types import Message
+
+
+class ChatTypeFilter(BaseFilter):
+    """Filter messages by chat type
+    
+    Used as a handler or router filter, so messages from other chat types are
+    dropped by the dispatcher before message middlewares or the handler run.
+    """
+    
+    def __init__(self, *chat_types: str):
+        """
+        Args:
+            *chat_types: Chat types to accept (e.g. "private", "group", "supergroup")
+        """
+        self.chat_types = frozenset(chat_types)
+    
+    async def __call__(self, message: Message) -> bool:
+        return message.chat is not None and message.chat.type in self.chat_types
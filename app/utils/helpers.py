@@ -0,0 +1,50 @@
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+try:
+    import uvloop
+except ImportError:  # optional, not available on Windows
+    uvloop = None
+
+
+def install_uvloop() -> bool:
+    """Make new event loops use uvloop when it is installed
+    
+    Must be called before the event loop is created. Returns whether uvloop is in use.
+    """
+    if uvloop is None:
+        return False
+    
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
+
+class Clock:
+    """Wall clock with one-second resolution for event payloads and logs
+    
+    A background task refreshes the ISO timestamp once per second, so hot paths
+    read a ready-made string instead of calling datetime.now().isoformat().
+    The ticker starts on first use inside a running event loop.
+    """
+    iso: str = ""
+    _task: Optional[asyncio.Task] = None
+    
+    @classmethod
+    def now_iso(cls) -> str:
+        """Get the current local time as an ISO string, accurate to about a second"""
+        if cls._task is None or cls._task.done():
+            cls.iso = datetime.now().isoformat()
+            try:
+                cls._task = asyncio.get_running_loop().create_task(cls._tick())
+            except RuntimeError:
+                # No running loop - just use the fresh value
+                pass
+        return cls.iso
+    
+    @classmethod
+    async def _tick(cls) -> None:
+        """Refresh the cached timestamp every second"""
+        while True:
+            await asyncio.sleep(1)
+            cls.iso = datetime.now().isoformat()
@@ -0,0 +1,32 @@
+from contextvars import ContextVar
+from typing import NamedTuple, Optional
+
+from app.models.user import UserRole
+
+
+class Permissions(NamedTuple):
+    """Role and Telegram chat status of the user the current update came from"""
+    user_id: Optional[int] = None
+    chat_id: Optional[int] = None
+    role: Optional[str] = None
+    chat_status: Optional[str] = None
+    
+    @property
+    def is_admin(self) -> bool:
+        """Whether the user is a bot admin"""
+        return self.role == UserRole.ADMIN
+    
+    @property
+    def is_moderator(self) -> bool:
+        """Whether the user is a bot moderator (admins are moderators too)"""
+        return self.role in (UserRole.ADMIN, UserRole.MODERATOR)
+    
+    @property
+    def is_chat_admin(self) -> bool:
+        """Whether the user is an administrator of the chat in Telegram"""
+        return self.chat_status in ("creator", "administrator")
+
+
+# Set by UserContextMiddleware once per message, so handlers and helpers can
+# check permissions without another database or getChatMember round trip
+current_permissions: ContextVar[Permissions] = ContextVar("current_permissions", default=Permissions())
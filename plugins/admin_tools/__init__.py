@@ -2,24 +2,30 @@
 Admin Tools Plugin for MyChatManager
 Advanced administration tools for large chat management
 """
-from typing import Dict, Callable, Any, List, Optional
+from typing import Dict, Callable, Any, List, Optional, Set, Tuple
 from datetime import datetime, timedelta
 import asyncio
-import re
-from aiogram import Router, F
+import html
+from string import Template
+from aiogram import Bot, Router, F
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
 from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import (
     Message, ChatPermissions, CallbackQuery, InlineKeyboardMarkup, 
-    InlineKeyboardButton, ChatMemberUpdated
+    InlineKeyboardButton, ChatMemberUpdated, Chat, User as TelegramUser
 )
 from loguru import logger
 
+from app.config.settings import settings
 from app.plugins.plugin_manager import PluginBase, PluginMetadata
 from app.services.user_service import user_service
+from app.services.chat_service import chat_service
 from app.models.user import User, UserRole
-from app.utils.decorators import admin_required, moderator_required, log_command, chat_type
+from app.utils.decorators import (
+    admin_required, log_command, group_command, moderator_group_command, admin_group_command
+)
 
 
 class AdminActions(StatesGroup):
@@ -31,6 +37,68 @@ class AdminActions(StatesGroup):
     waiting_for_rules_message = State()
 
 
+_TEXT_VARIABLES_HELP = (
+    "You can use the following variables:\n"
+    "$name - User's first name\n"
+    "$username - User's username\n"
+    "$mention - Mention the user\n"
+    "$chat - Chat name"
+)
+
+# Chat text key -> (state waiting for the text, prompt, reply once saved)
+CHAT_TEXT_COMMANDS = {
+    "welcome": (
+        AdminActions.waiting_for_welcome_message,
+        "Please enter the welcome message for new members.\n\n" + _TEXT_VARIABLES_HELP,
+        "✅ Welcome message has been set!\n\n"
+        "Preview:\n{text}\n\n"
+        "Available variables: $name, $username, $mention, $chat",
+    ),
+    "goodbye": (
+        AdminActions.waiting_for_goodbye_message,
+        "Please enter the goodbye message for leaving members.\n\n" + _TEXT_VARIABLES_HELP,
+        "✅ Goodbye message has been set!\n\n"
+        "Preview:\n{text}\n\n"
+        "Available variables: $name, $username, $mention, $chat",
+    ),
+    "rules": (
+        AdminActions.waiting_for_rules_message,
+        "Please enter the rules for this chat.\n"
+        "Use clear formatting and numbering for best readability.",
+        "✅ Chat rules have been set!\n\n"
+        "Preview:\n{text}",
+    ),
+}
+
+
+# Confirmation keyboards are static, so they are built once
+UNPIN_ALL_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="✅ Yes", callback_data="unpinall_confirm"),
+        InlineKeyboardButton(text="❌ No", callback_data="unpinall_cancel")
+    ]
+])
+
+BROADCAST_KEYBOARD = InlineKeyboardMarkup(inline_keyboard=[
+    [
+        InlineKeyboardButton(text="✅ Send", callback_data="broadcast_confirm"),
+        InlineKeyboardButton(text="❌ Cancel", callback_data="broadcast_cancel")
+    ]
+])
+
+# Chat permissions shown by /chatinfo, as (label, ChatPermissions field)
+PERMISSION_FIELDS = (
+    ("Send messages", "can_send_messages"),
+    ("Send media", "can_send_media_messages"),
+    ("Send polls", "can_send_polls"),
+    ("Send other messages", "can_send_other_messages"),
+    ("Add web page previews", "can_add_web_page_previews"),
+    ("Change info", "can_change_info"),
+    ("Invite users", "can_invite_users"),
+    ("Pin messages", "can_pin_messages"),
+)
+
+
 class AdminToolsPlugin(PluginBase):
     """Plugin for advanced admin tools"""
     
@@ -49,6 +117,20 @@ class AdminToolsPlugin(PluginBase):
         super().__init__(manager)
         self.router = Router(name="admin_tools")
         
+        # Max concurrent deleteMessage requests when bulk deletion isn't possible
+        self.delete_concurrency = 10
+        
+        # Max concurrent sends during a broadcast (Telegram allows ~30 messages/s)
+        self.broadcast_concurrency = 25
+        
+        # Joins/leaves within this many seconds are announced in one message per chat
+        self.member_batch_delay = 5.0
+        # (chat_id, "join" | "left" | "kicked") -> users waiting to be announced
+        self._member_batches: Dict[Tuple[int, str], List[TelegramUser]] = {}
+        
+        # Strong references to fire-and-forget tasks, so they aren't garbage collected mid-run
+        self._background_tasks: Set[asyncio.Task] = set()
+        
         # Register handlers
         self.router.message(Command("purge"))(self.cmd_purge)
         self.router.message(AdminActions.waiting_for_purge_count)(self.process_purge_count)
@@ -56,21 +138,24 @@ class AdminToolsPlugin(PluginBase):
         self.router.message(Command("pin"))(self.cmd_pin)
         self.router.message(Command("unpin"))(self.cmd_unpin)
         self.router.message(Command("unpinall"))(self.cmd_unpin_all)
+        self.router.callback_query(F.data == "unpinall_confirm")(self.confirm_unpin_all)
+        self.router.callback_query(F.data == "unpinall_cancel")(self.cancel_unpin_all)
         
         self.router.message(Command("stats"))(self.cmd_stats)
         self.router.message(Command("chatinfo"))(self.cmd_chat_info)
         
-        self.router.message(Command("welcome"))(self.cmd_welcome)
-        self.router.message(AdminActions.waiting_for_welcome_message)(self.process_welcome_message)
-        
-        self.router.message(Command("goodbye"))(self.cmd_goodbye)
-        self.router.message(AdminActions.waiting_for_goodbye_message)(self.process_goodbye_message)
-        
-        self.router.message(Command("setrules"))(self.cmd_set_rules)
-        self.router.message(AdminActions.waiting_for_rules_message)(self.process_rules_message)
+        # /welcome, /goodbye and /setrules differ only in their texts and state
+        self.chat_text_commands: Dict[str, Callable] = {}
+        for command_name, key in (("welcome", "welcome"), ("goodbye", "goodbye"), ("setrules", "rules")):
+            cmd_set_text, process_text = self._chat_text_handlers(key)
+            self.router.message(Command(command_name))(cmd_set_text)
+            self.router.message(CHAT_TEXT_COMMANDS[key][0])(process_text)
+            self.chat_text_commands[command_name] = cmd_set_text
         
         self.router.message(Command("broadcast"))(self.cmd_broadcast)
         self.router.message(AdminActions.waiting_for_broadcast_message)(self.process_broadcast_message)
+        self.router.callback_query(F.data == "broadcast_confirm")(self.confirm_broadcast)
+        self.router.callback_query(F.data == "broadcast_cancel")(self.cancel_broadcast)
         
         self.router.message(Command("promote"))(self.cmd_promote)
         self.router.message(Command("demote"))(self.cmd_demote)
@@ -94,9 +179,7 @@ class AdminToolsPlugin(PluginBase):
             "unpinall": self.cmd_unpin_all,
             "stats": self.cmd_stats,
             "chatinfo": self.cmd_chat_info,
-            "welcome": self.cmd_welcome,
-            "goodbye": self.cmd_goodbye,
-            "setrules": self.cmd_set_rules,
+            **self.chat_text_commands,
             "broadcast": self.cmd_broadcast,
             "promote": self.cmd_promote,
             "demote": self.cmd_demote,
@@ -107,9 +190,84 @@ class AdminToolsPlugin(PluginBase):
         """Get plugin middlewares"""
         return []
     
-    @admin_required
-    @log_command
-    @chat_type("group", "supergroup")
+    async def _save_chat_text(self, message: Message, key: str, text: str) -> bool:
+        """Save a welcome, goodbye or rules text for the message's chat, replying on failure"""
+        try:
+            if await chat_service.set_chat_text(message.chat.id, key, text):
+                return True
+            await message.reply("❌ This chat is not registered yet, please try again in a moment.")
+        except Exception as e:
+            logger.error(f"Failed to save {key} text: {e}")
+            await message.reply(f"❌ Failed to save the {key} text: {str(e)}")
+        return False
+    
+    @staticmethod
+    def _render_chat_text(template: str, users: List[TelegramUser], chat: Chat) -> str:
+        """Fill in $name, $username, $mention and $chat in a welcome/goodbye text
+        
+        With several users, each user variable lists all of them.
+        """
+        return Template(template).safe_substitute(
+            name=", ".join(html.escape(user.first_name) for user in users),
+            username=", ".join(
+                f"@{user.username}" if user.username else html.escape(user.first_name) for user in users
+            ),
+            mention=", ".join(
+                f'<a href="tg://user?id={user.id}">{html.escape(user.full_name)}</a>' for user in users
+            ),
+            chat=html.escape(chat.title or ""),
+        )
+    
+    async def _send_temporary(self, message: Message, text: str, delay: float = 5.0) -> None:
+        """Send a status message to the chat and delete it after a delay, without waiting for that"""
+        status_msg = await message.chat.send_message(text)
+        
+        async def delete_later():
+            await asyncio.sleep(delay)
+            try:
+                await status_msg.delete()
+            except Exception as e:
+                logger.debug(f"Could not delete status message: {e}")
+        
+        task = asyncio.create_task(delete_later())
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _delete_messages(self, message: Message, message_ids: List[int]) -> int:
+        """Delete messages from the chat, up to 100 per deleteMessages request
+        
+        Falls back to deleting one by one if a bulk request fails.
+        Returns an upper bound on the number of messages deleted: deleteMessages
+        silently skips IDs that are missing or can't be deleted, so a successful
+        bulk request counts its whole batch.
+        """
+        deleted = 0
+        for i in range(0, len(message_ids), 100):
+            batch = message_ids[i:i + 100]
+            try:
+                await message.bot.delete_messages(chat_id=message.chat.id, message_ids=batch)
+                deleted += len(batch)
+                continue
+            except Exception as e:
+                logger.debug(f"Bulk delete failed, deleting messages one by one: {e}")
+            
+            # Delete the batch concurrently, a few requests in flight at a time
+            semaphore = asyncio.Semaphore(self.delete_concurrency)
+            
+            async def delete_one(msg_id: int) -> int:
+                async with semaphore:
+                    try:
+                        await message.chat.delete_message(msg_id)
+                        return 1
+                    except Exception as e:
+                        logger.debug(f"Could not delete message {msg_id}: {e}")
+                        return 0
+            
+            deleted += sum(await asyncio.gather(*(delete_one(msg_id) for msg_id in batch)))
+        
+        return deleted
+    
+    @admin_group_command
     async def cmd_purge(self, message: Message, state: FSMContext, **kwargs):
         """Handle the /purge command to delete multiple messages"""
         # Check if message is a reply
@@ -120,32 +278,18 @@ class AdminToolsPlugin(PluginBase):
             # Get the message IDs
             start_message_id = message.reply_to_message.message_id
             end_message_id = message.message_id
-            count = end_message_id - start_message_id
             
             # Delete the messages
-            deleted = 0
-            for msg_id in range(start_message_id, end_message_id + 1):
-                try:
-                    await message.chat.delete_message(msg_id)
-                    deleted += 1
-                    # Add a small delay to prevent flooding
-                    if deleted % 10 == 0:
-                        await asyncio.sleep(0.5)
-                except Exception as e:
-                    logger.debug(f"Could not delete message {msg_id}: {e}")
+            deleted = await self._delete_messages(message, list(range(start_message_id, end_message_id + 1)))
             
             # Send success message and delete it after a few seconds
-            status_msg = await message.chat.send_message(f"🧹 Purged {deleted} messages.")
-            await asyncio.sleep(5)
-            await status_msg.delete()
+            await self._send_temporary(message, f"🧹 Purged up to {deleted} messages.")
         else:
             # Ask for number of messages to purge
             await message.reply("How many recent messages do you want to purge? (max 100)")
             await state.set_state(AdminActions.waiting_for_purge_count)
     
-    @admin_required
-    @log_command
-    @chat_type("group", "supergroup")
+    @admin_group_command
     async def process_purge_count(self, message: Message, state: FSMContext, **kwargs):
         """Process the number of messages to purge"""
         try:
@@ -161,32 +305,18 @@ class AdminToolsPlugin(PluginBase):
             message_id = message.message_id
             
             # Delete messages
-            deleted = 0
-            for i in range(message_id - count, message_id + 1):
-                if i <= 0:
-                    continue
-                try:
-                    await message.chat.delete_message(i)
-                    deleted += 1
-                    # Add a small delay to prevent flooding
-                    if deleted % 10 == 0:
-                        await asyncio.sleep(0.5)
-                except Exception as e:
-                    logger.debug(f"Could not delete message {i}: {e}")
+            start = max(1, message_id - count)
+            deleted = await self._delete_messages(message, list(range(start, message_id + 1)))
             
             # Send success message and delete it after a few seconds
-            status_msg = await message.chat.send_message(f"🧹 Purged {deleted} messages.")
-            await asyncio.sleep(5)
-            await status_msg.delete()
+            await self._send_temporary(message, f"🧹 Purged up to {deleted} messages.")
             
         except ValueError:
             await message.reply("⚠️ Please enter a valid number.")
         finally:
             await state.clear()
     
-    @moderator_required
-    @log_command
-    @chat_type("group", "supergroup")
+    @moderator_group_command
     async def cmd_pin(self, message: Message, **kwargs):
         """Handle the /pin command to pin a message"""
         # Check if message is a reply
@@ -202,9 +332,7 @@ class AdminToolsPlugin(PluginBase):
             logger.error(f"Failed to pin message: {e}")
             await message.reply(f"❌ Failed to pin message: {str(e)}")
     
-    @moderator_required
-    @log_command
-    @chat_type("group", "supergroup")
+    @moderator_group_command
     async def cmd_unpin(self, message: Message, **kwargs):
         """Handle the /unpin command to unpin a message"""
         try:
@@ -220,47 +348,59 @@ class AdminToolsPlugin(PluginBase):
             logger.error(f"Failed to unpin message: {e}")
             await message.reply(f"❌ Failed to unpin message: {str(e)}")
     
-    @admin_required
-    @log_command
-    @chat_type("group", "supergroup")
-    async def cmd_unpin_all(self, message: Message, **kwargs):
+    @admin_group_command
+    async def cmd_unpin_all(self, message: Message, state: FSMContext, **kwargs):
         """Handle the /unpinall command to unpin all messages"""
         try:
-            # Create confirmation keyboard
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [
-                    InlineKeyboardButton(text="✅ Yes", callback_data="unpinall_confirm"),
-                    InlineKeyboardButton(text="❌ No", callback_data="unpinall_cancel")
-                ]
-            ])
-            
-            await message.reply(
+            prompt = await message.reply(
                 "⚠️ Are you sure you want to unpin ALL pinned messages in this chat?",
-                reply_markup=keyboard
+                reply_markup=UNPIN_ALL_KEYBOARD
             )
             
-            # Register callback handler for the confirmation
-            @self.router.callback_query(F.data == "unpinall_confirm")
-            async def confirm_unpin_all(callback: CallbackQuery):
-                await callback.answer()
-                try:
-                    await callback.message.chat.unpin_all_messages()
-                    await callback.message.edit_text("📌 All pinned messages have been unpinned.")
-                except Exception as e:
-                    logger.error(f"Failed to unpin all messages: {e}")
-                    await callback.message.edit_text(f"❌ Failed to unpin all messages: {str(e)}")
-            
-            @self.router.callback_query(F.data == "unpinall_cancel")
-            async def cancel_unpin_all(callback: CallbackQuery):
-                await callback.answer()
-                await callback.message.edit_text("Operation cancelled.")
+            # Remember which prompt this admin opened for the confirmation callback
+            await state.update_data(pending_unpin_all=prompt.message_id)
                 
         except Exception as e:
             logger.error(f"Failed to unpin all messages: {e}")
             await message.reply(f"❌ Failed to unpin all messages: {str(e)}")
     
-    @log_command
-    @chat_type("group", "supergroup")
+    @staticmethod
+    async def _take_pending_unpin_all(callback: CallbackQuery, state: FSMContext) -> bool:
+        """Check that the presser opened this unpin-all prompt, and consume it
+        
+        Callback queries skip AuthMiddleware's checks, and state is per user and chat,
+        so only the admin who ran /unpinall has the prompt recorded.
+        """
+        data = await state.get_data()
+        if data.get("pending_unpin_all") != callback.message.message_id:
+            await callback.answer("❌ Only the admin who ran /unpinall can answer this.", show_alert=True)
+            return False
+        
+        await state.update_data(pending_unpin_all=None)
+        return True
+    
+    async def confirm_unpin_all(self, callback: CallbackQuery, state: FSMContext, **kwargs):
+        """Unpin all messages in the chat the confirmation was sent to"""
+        if not await self._take_pending_unpin_all(callback, state):
+            return
+        
+        await callback.answer()
+        try:
+            await callback.message.chat.unpin_all_messages()
+            await callback.message.edit_text("📌 All pinned messages have been unpinned.")
+        except Exception as e:
+            logger.error(f"Failed to unpin all messages: {e}")
+            await callback.message.edit_text(f"❌ Failed to unpin all messages: {str(e)}")
+    
+    async def cancel_unpin_all(self, callback: CallbackQuery, state: FSMContext, **kwargs):
+        """Cancel unpinning all messages"""
+        if not await self._take_pending_unpin_all(callback, state):
+            return
+        
+        await callback.answer()
+        await callback.message.edit_text("Operation cancelled.")
+    
+    @group_command
     async def cmd_stats(self, message: Message, **kwargs):
         """Handle the /stats command to show user or chat statistics"""
         # Check if the user wants personal stats or chat stats
@@ -270,12 +410,13 @@ class AdminToolsPlugin(PluginBase):
             user = await user_service.get_user_by_telegram_id(user_id)
             
             if user:
+                # isoformat() is implemented in C, unlike strftime's format parsing;
+                # updated_at is refreshed whenever the user is seen
+                last_active = user.updated_at.isoformat(sep=' ', timespec='seconds') if user.updated_at else "unknown"
                 stats_text = (
                     f"📊 <b>Your Statistics</b>\n\n"
-                    f"Messages sent: {user.message_count}\n"
-                    f"Commands used: {user.command_count}\n"
-                    f"Warnings received: {user.warning_count}\n"
-                    f"Last active: {user.last_activity.strftime('%Y-%m-%d %H:%M:%S')}\n"
+                    f"Warnings received: {user.warnings_count or 0}\n"
+                    f"Last active: {last_active}\n"
                 )
                 
                 await message.reply(stats_text)
@@ -284,196 +425,81 @@ class AdminToolsPlugin(PluginBase):
         else:
             await message.reply("This command is only available in group chats.")
     
-    @log_command
-    @chat_type("group", "supergroup")
+    @group_command
     async def cmd_chat_info(self, message: Message, **kwargs):
         """Handle the /chatinfo command to show information about the chat"""
         chat = message.chat
         
         # Get chat data from Telegram
         try:
-            chat_info = await chat.get_chat()
-            member_count = await chat.get_member_count()
+            # Independent requests, so they run concurrently
+            chat_info, member_count = await asyncio.gather(
+                message.bot.get_chat(chat.id),
+                chat.get_member_count()
+            )
             
             # Format chat info
-            chat_info_text = (
+            parts = [
                 f"📋 <b>Chat Information</b>\n\n"
                 f"<b>Basic Info:</b>\n"
                 f"ID: {chat.id}\n"
                 f"Type: {chat.type}\n"
                 f"Title: {chat_info.title}\n"
                 f"Members: {member_count}\n"
-            )
+            ]
             
             # Add optional fields if available
-            if hasattr(chat_info, 'description') and chat_info.description:
-                chat_info_text += f"\n<b>Description:</b>\n{chat_info.description}\n"
+            if getattr(chat_info, 'description', None):
+                parts.append(f"\n<b>Description:</b>\n{chat_info.description}\n")
                 
-            if hasattr(chat_info, 'invite_link') and chat_info.invite_link:
-                chat_info_text += f"\n<b>Invite Link:</b>\n{chat_info.invite_link}\n"
+            if getattr(chat_info, 'invite_link', None):
+                parts.append(f"\n<b>Invite Link:</b>\n{chat_info.invite_link}\n")
             
             # Add permissions info if available
-            if hasattr(chat_info, 'permissions') and chat_info.permissions:
-                perms = chat_info.permissions
-                chat_info_text += (
-                    f"\n<b>Default Permissions:</b>\n"
-                    f"Send messages: {perms.can_send_messages or False}\n"
-                    f"Send media: {perms.can_send_media_messages or False}\n"
-                    f"Send polls: {perms.can_send_polls or False}\n"
-                    f"Send other messages: {perms.can_send_other_messages or False}\n"
-                    f"Add web page previews: {perms.can_add_web_page_previews or False}\n"
-                    f"Change info: {perms.can_change_info or False}\n"
-                    f"Invite users: {perms.can_invite_users or False}\n"
-                    f"Pin messages: {perms.can_pin_messages or False}\n"
+            perms = getattr(chat_info, 'permissions', None)
+            if perms:
+                parts.append("\n<b>Default Permissions:</b>\n")
+                parts.extend(
+                    f"{label}: {bool(getattr(perms, field, False))}\n" for label, field in PERMISSION_FIELDS
                 )
             
             # Send the info
-            await message.reply(chat_info_text)
+            await message.reply("".join(parts))
             
         except Exception as e:
             logger.error(f"Failed to get chat info: {e}")
             await message.reply("❌ Failed to get chat information.")
     
-    @admin_required
-    @log_command
-    @chat_type("group", "supergroup")
-    async def cmd_welcome(self, message: Message, state: FSMContext, **kwargs):
-        """Handle the /welcome command to set welcome message"""
-        if len(message.text.split(maxsplit=1)) > 1:
-            # Command has the welcome message in it
-            welcome_text = message.text.split(maxsplit=1)[1]
-            
-            # Save to database or config
-            # In a real implementation, this would save to database
-            
-            await message.reply(
-                f"✅ Welcome message has been set!\n\n"
-                f"Preview:\n{welcome_text}\n\n"
-                f"Available variables: $name, $username, $mention, $chat"
-            )
-        else:
-            # Ask for the welcome message
-            await message.reply(
-                "Please enter the welcome message for new members.\n\n"
-                "You can use the following variables:\n"
-                "$name - User's first name\n"
-                "$username - User's username\n"
-                "$mention - Mention the user\n"
-                "$chat - Chat name"
-            )
-            
-            await state.set_state(AdminActions.waiting_for_welcome_message)
-    
-    @admin_required
-    @log_command
-    @chat_type("group", "supergroup")
-    async def process_welcome_message(self, message: Message, state: FSMContext, **kwargs):
-        """Process the welcome message"""
-        welcome_text = message.text
-        
-        # Save to database or config
-        # In a real implementation, this would save to database
-        
-        await message.reply(
-            f"✅ Welcome message has been set!\n\n"
-            f"Preview:\n{welcome_text}\n\n"
-            f"Available variables: $name, $username, $mention, $chat"
-        )
-        
-        # Clear state
-        await state.clear()
-    
-    @admin_required
-    @log_command
-    @chat_type("group", "supergroup")
-    async def cmd_goodbye(self, message: Message, state: FSMContext, **kwargs):
-        """Handle the /goodbye command to set goodbye message"""
-        if len(message.text.split(maxsplit=1)) > 1:
-            # Command has the goodbye message in it
-            goodbye_text = message.text.split(maxsplit=1)[1]
-            
-            # Save to database or config
-            # In a real implementation, this would save to database
-            
-            await message.reply(
-                f"✅ Goodbye message has been set!\n\n"
-                f"Preview:\n{goodbye_text}\n\n"
-                f"Available variables: $name, $username, $mention, $chat"
-            )
-        else:
-            # Ask for the goodbye message
-            await message.reply(
-                "Please enter the goodbye message for leaving members.\n\n"
-                "You can use the following variables:\n"
-                "$name - User's first name\n"
-                "$username - User's username\n"
-                "$mention - Mention the user\n"
-                "$chat - Chat name"
-            )
-            
-            await state.set_state(AdminActions.waiting_for_goodbye_message)
-    
-    @admin_required
-    @log_command
-    @chat_type("group", "supergroup")
-    async def process_goodbye_message(self, message: Message, state: FSMContext, **kwargs):
-        """Process the goodbye message"""
-        goodbye_text = message.text
-        
-        # Save to database or config
-        # In a real implementation, this would save to database
-        
-        await message.reply(
-            f"✅ Goodbye message has been set!\n\n"
-            f"Preview:\n{goodbye_text}\n\n"
-            f"Available variables: $name, $username, $mention, $chat"
-        )
-        
-        # Clear state
-        await state.clear()
-    
-    @admin_required
-    @log_command
-    @chat_type("group", "supergroup")
-    async def cmd_set_rules(self, message: Message, state: FSMContext, **kwargs):
-        """Handle the /setrules command to set chat rules"""
-        if len(message.text.split(maxsplit=1)) > 1:
-            # Command has the rules in it
-            rules_text = message.text.split(maxsplit=1)[1]
-            
-            # Save to database or config
-            # In a real implementation, this would save to database
-            
-            await message.reply(
-                f"✅ Chat rules have been set!\n\n"
-                f"Preview:\n{rules_text}"
-            )
-        else:
-            # Ask for the rules
-            await message.reply(
-                "Please enter the rules for this chat.\n"
-                "Use clear formatting and numbering for best readability."
-            )
-            
-            await state.set_state(AdminActions.waiting_for_rules_message)
-    
-    @admin_required
-    @log_command
-    @chat_type("group", "supergroup")
-    async def process_rules_message(self, message: Message, state: FSMContext, **kwargs):
-        """Process the rules message"""
-        rules_text = message.text
-        
-        # Save to database or config
-        # In a real implementation, this would save to database
-        
-        await message.reply(
-            f"✅ Chat rules have been set!\n\n"
-            f"Preview:\n{rules_text}"
-        )
-        
-        # Clear state
-        await state.clear()
+    def _chat_text_handlers(self, key: str) -> Tuple[Callable, Callable]:
+        """Build the command and follow-up message handlers for setting a chat text"""
+        waiting_state, prompt, saved_reply = CHAT_TEXT_COMMANDS[key]
+        
+        async def save(message: Message, text: str) -> bool:
+            # Save to database and cache
+            if not await self._save_chat_text(message, key, text):
+                return False
+            
+            await message.reply(saved_reply.format(text=text))
+            return True
+        
+        @admin_group_command
+        async def cmd_set_text(message: Message, command: CommandObject, state: FSMContext, **kwargs):
+            if command.args:
+                # Command has the text in it
+                await save(message, command.args)
+            else:
+                # Ask for the text
+                await message.reply(prompt)
+                await state.set_state(waiting_state)
+        
+        @admin_group_command
+        async def process_text(message: Message, state: FSMContext, **kwargs):
+            if await save(message, message.text):
+                await state.clear()
+        
+        cmd_set_text.__doc__ = f"Handle the command to set the chat's {key} text"
+        process_text.__doc__ = f"Process the {key} text"
+        return cmd_set_text, process_text
     
     @admin_required
     @log_command
@@ -494,50 +520,92 @@ class AdminToolsPlugin(PluginBase):
         broadcast_text = message.text
         
         # Confirm before sending
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [
-                InlineKeyboardButton(text="✅ Send", callback_data="broadcast_confirm"),
-                InlineKeyboardButton(text="❌ Cancel", callback_data="broadcast_cancel")
-            ]
-        ])
-        
         await message.reply(
             f"Are you sure you want to broadcast this message to all chats?\n\n"
             f"Message:\n{broadcast_text}",
-            reply_markup=keyboard
+            reply_markup=BROADCAST_KEYBOARD
         )
         
-        # Store the message in state
+        # Store the message in state for the confirmation callback
         await state.update_data(broadcast_text=broadcast_text)
+    
+    async def confirm_broadcast(self, callback: CallbackQuery, state: FSMContext, **kwargs):
+        """Send the broadcast message stored in state"""
+        # Callback queries skip AuthMiddleware's checks, so check the presser here
+        if not await self._is_bot_admin(callback.from_user.id):
+            await callback.answer("❌ Only administrators can broadcast.", show_alert=True)
+            return
         
-        # Register callback handlers
-        @self.router.callback_query(F.data == "broadcast_confirm")
-        async def confirm_broadcast(callback: CallbackQuery, state: FSMContext):
-            data = await state.get_data()
-            broadcast_text = data.get('broadcast_text', '')
-            
-            await callback.answer()
-            await callback.message.edit_text("Broadcasting message... This may take some time.")
-            
-            # In a real implementation, this would get all chats from the database
-            # and send the message to each one
-            
-            await callback.message.edit_text("✅ Message has been broadcasted.")
-            
-            # Clear state
-            await state.clear()
+        # State is per user: a stale button, or one pressed by another admin, has no text
+        data = await state.get_data()
+        broadcast_text = data.get('broadcast_text', '')
+        if not broadcast_text:
+            await callback.answer("❌ No broadcast message pending. Use /broadcast again.", show_alert=True)
+            return
         
-        @self.router.callback_query(F.data == "broadcast_cancel")
-        async def cancel_broadcast(callback: CallbackQuery, state: FSMContext):
-            await callback.answer()
-            await callback.message.edit_text("Broadcast cancelled.")
-            
-            # Clear state
-            await state.clear()
+        await callback.answer()
+        await callback.message.edit_text("Broadcasting message... This may take some time.")
+        
+        # Clear state before the fan-out so the admin isn't locked out meanwhile
+        await state.clear()
+        
+        chat_ids = await chat_service.list_active_chat_telegram_ids()
+        sent = await self._broadcast(callback.bot, chat_ids, broadcast_text)
+        
+        await callback.message.edit_text(f"✅ Message has been broadcasted to {sent}/{len(chat_ids)} chats.")
     
-    @admin_required
-    @log_command
-    @chat_type("group", "supergroup")
+    @staticmethod
+    async def _is_bot_admin(user_id: int) -> bool:
+        """Check whether a user is a bot administrator (from settings or by role)"""
+        if user_id in settings.bot.ADMIN_IDS:
+            return True
+        
+        auth_user = await user_service.fetch_auth(user_id)
+        return auth_user is not None and auth_user.role == UserRole.ADMIN
+    
+    async def _broadcast(self, bot: Bot, chat_ids: List[int], text: str) -> int:
+        """Send a message to many chats, a bounded number at a time
+        
+        A flood-wait from Telegram pauses every sender, not just the one that hit it.
+        Returns the number of chats the message was delivered to.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.broadcast_concurrency)
+        resume_at = 0.0
+        
+        async def send_one(chat_id: int) -> bool:
+            nonlocal resume_at
+            async with semaphore:
+                for _ in range(3):
+                    delay = resume_at - loop.time()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    
+                    try:
+                        await bot.send_message(chat_id, text)
+                        return True
+                    except TelegramRetryAfter as e:
+                        resume_at = max(resume_at, loop.time() + e.retry_after)
+                    except TelegramForbiddenError:
+                        # The bot was removed from the chat
+                        return False
+                    except Exception as e:
+                        logger.debug(f"Could not broadcast to chat {chat_id}: {e}")
+                        return False
+                return False
+        
+        results = await asyncio.gather(*(send_one(chat_id) for chat_id in chat_ids))
+        return sum(results)
+    
+    async def cancel_broadcast(self, callback: CallbackQuery, state: FSMContext, **kwargs):
+        """Cancel the pending broadcast"""
+        await callback.answer()
+        await callback.message.edit_text("Broadcast cancelled.")
+        
+        # Clear state
+        await state.clear()
+    
+    @admin_group_command
     async def cmd_promote(self, message: Message, **kwargs):
         """Handle the /promote command to promote a user to admin"""
         # Check if message is a reply
@@ -565,9 +633,7 @@ class AdminToolsPlugin(PluginBase):
             logger.error(f"Failed to promote user: {e}")
             await message.reply(f"❌ Failed to promote user: {str(e)}")
     
-    @admin_required
-    @log_command
-    @chat_type("group", "supergroup")
+    @admin_group_command
     async def cmd_demote(self, message: Message, **kwargs):
         """Handle the /demote command to demote an admin to regular user"""
         # Check if message is a reply
@@ -595,17 +661,13 @@ class AdminToolsPlugin(PluginBase):
             logger.error(f"Failed to demote user: {e}")
             await message.reply(f"❌ Failed to demote user: {str(e)}")
     
-    @moderator_required
-    @log_command
-    @chat_type("group", "supergroup")
+    @moderator_group_command
     async def cmd_slowmode(self, message: Message, command: CommandObject, **kwargs):
         """Handle the /slowmode command to set chat slow mode"""
-        args = command.args or ""
-        
-        # Parse the argument
-        match = re.match(r'^(\d+)$', args.strip())
+        args = (command.args or "").strip()
         
-        if not match:
+        # Parse the argument (isascii() rules out non-ASCII digits int() can't parse)
+        if not (args.isascii() and args.isdigit()):
             await message.reply(
                 "⚠️ Please specify the slow mode delay in seconds.\n"
                 "Usage: /slowmode <seconds>\n"
@@ -614,7 +676,7 @@ class AdminToolsPlugin(PluginBase):
             )
             return
         
-        seconds = int(match.group(1))
+        seconds = int(args)
         
         try:
             # Set slow mode delay
@@ -635,27 +697,52 @@ class AdminToolsPlugin(PluginBase):
         old_status = update.old_chat_member.status if update.old_chat_member else None
         new_status = update.new_chat_member.status if update.new_chat_member else None
         
+        # Promotions, demotions and leaves make the cached status stale
+        if old_status != new_status:
+            member = update.new_chat_member or update.old_chat_member
+            await chat_service.invalidate_member_status(update.chat.id, member.user.id)
+        
         if new_status == "member" and (old_status in [None, "left", "kicked"]):
             # User joined the chat
-            # In a real implementation, this would get the welcome message from database
-            # and send it with proper formatting
-            welcome_text = f"👋 Welcome to the chat, {update.new_chat_member.user.full_name}!"
-            
-            try:
-                await update.chat.send_message(welcome_text)
-            except Exception as e:
-                logger.error(f"Failed to send welcome message: {e}")
+            self._queue_member_announcement(update.chat, "join", update.new_chat_member.user)
         
         elif old_status == "member" and new_status in ["left", "kicked"]:
             # User left the chat or was kicked
-            # In a real implementation, this would get the goodbye message from database
-            # and send it with proper formatting
-            if new_status == "left":
-                goodbye_text = f"👋 {update.old_chat_member.user.full_name} has left the chat."
+            self._queue_member_announcement(update.chat, new_status, update.old_chat_member.user)
+    
+    def _queue_member_announcement(self, chat: Chat, kind: str, user: TelegramUser) -> None:
+        """Add a user to the chat's pending join/leave announcement, starting its timer if new"""
+        key = (chat.id, kind)
+        batch = self._member_batches.get(key)
+        if batch is None:
+            batch = self._member_batches[key] = []
+            task = asyncio.create_task(self._flush_member_announcement(chat, kind))
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+        batch.append(user)
+    
+    async def _flush_member_announcement(self, chat: Chat, kind: str) -> None:
+        """Wait for the batch window to close, then send one message for all its users"""
+        await asyncio.sleep(self.member_batch_delay)
+        users = self._member_batches.pop((chat.id, kind))
+        names = ", ".join(html.escape(user.full_name) for user in users)
+        
+        try:
+            if kind == "join":
+                template = await chat_service.get_chat_text(chat.id, "welcome")
+                if template:
+                    text = self._render_chat_text(template, users, chat)
+                else:
+                    text = f"👋 Welcome to the chat, {names}!"
             else:
-                goodbye_text = f"🚫 {update.old_chat_member.user.full_name} has been removed from the chat."
-            
-            try:
-                await update.chat.send_message(goodbye_text)
-            except Exception as e:
-                logger.error(f"Failed to send goodbye message: {e}") 
\ No newline at end of file
+                template = await chat_service.get_chat_text(chat.id, "goodbye")
+                if template:
+                    text = self._render_chat_text(template, users, chat)
+                elif kind == "left":
+                    text = f"👋 {names} {'has' if len(users) == 1 else 'have'} left the chat."
+                else:
+                    text = f"🚫 {names} {'has' if len(users) == 1 else 'have'} been removed from the chat."
+            
+            await chat.send_message(text)
+        except Exception as e:
+            logger.error(f"Failed to send {'welcome' if kind == 'join' else 'goodbye'} message: {e}") 
\ No newline at end of file
@@ -2,13 +2,20 @@
 Anti-Spam Plugin for MyChatManager
 Advanced spam detection and prevention for large Telegram groups
 """
-from typing import Dict, Callable, Any, List, Optional, Set
+from typing import Dict, Callable, Any, List, Optional, Set, Tuple, Deque, Awaitable
 import re
 import time
+import hashlib
+import heapq
+import itertools
+from functools import partial
 import asyncio
-from collections import defaultdict, Counter
-from datetime import datetime, timedelta
-from aiogram import Router, F
+import threading
+from array import array
+from bisect import bisect_right
+from collections import defaultdict, Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from aiogram import Bot, Router, F
 from aiogram.filters import Command, CommandObject
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from loguru import logger
@@ -19,6 +26,62 @@ from app.models.user import User, UserRole
 from app.utils.decorators import admin_required, moderator_required, log_command, chat_type
 from app.events.event_manager import event_manager
 
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of a (casefolded) text over its words and word pairs
+    
+    Texts differing by a few edits get fingerprints a few bits apart;
+    punctuation is ignored. Texts without words (emoji, "?!") get a plain hash
+    of the whole text, so only identical ones count as similar.
+    """
+    words = _WORD_RE.findall(text)
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if not features:
+        return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+    
+    # Per bit position, count how many feature hashes have it set (column counts done in C)
+    bit_rows = [
+        format(int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big"), "064b")
+        for feature in features
+    ]
+    majority = len(features) / 2
+    fingerprint = 0
+    for column in zip(*bit_rows):
+        fingerprint = (fingerprint << 1) | (column.count("1") > majority)
+    return fingerprint
+
+
+class FloodConfig:
+    """Anti-spam limits for a chat"""
+    __slots__ = ("messages_per_minute", "similar_messages_limit", "max_forwards", "url_limit", "action")
+    
+    def __init__(
+        self,
+        messages_per_minute: int = 10,
+        similar_messages_limit: int = 3,
+        max_forwards: int = 5,
+        url_limit: int = 3,
+        action: str = "warn"  # 'warn', 'mute', 'kick' or 'ban'
+    ):
+        self.messages_per_minute = messages_per_minute
+        self.similar_messages_limit = similar_messages_limit
+        self.max_forwards = max_forwards
+        self.url_limit = url_limit
+        self.action = action
+
 
 class AntiSpamPlugin(PluginBase):
     """Plugin for advanced spam detection and prevention"""
@@ -39,23 +102,44 @@ class AntiSpamPlugin(PluginBase):
         self.router = Router(name="antispam")
         
         # Message tracking for flood detection
-        self.message_history = defaultdict(list)  # chat_id -> [(user_id, timestamp), ...]
-        self.user_message_counts = defaultdict(lambda: defaultdict(int))  # chat_id -> {user_id: count}
+        self.flood_window = 60  # seconds
+        # (chat_id, user_id) -> timestamps of the user's messages in the last flood_window
+        # seconds, oldest first, as a packed array of doubles rather than float objects
+        self.message_history: Dict[Tuple[int, int], array] = {}
+        
+        # Similar message detection: (chat_id, user_id) -> (expires at, SimHash) of the
+        # user's messages in the last similar_window seconds, in arrival order
+        self.similar_window = 300
+        self.similar_max_distance = 6  # max differing fingerprint bits for "similar"
+        self.recent_texts: Dict[Tuple[int, int], Deque[Tuple[float, int]]] = {}
+        self.user_message_counts: Counter = Counter()  # (chat_id, user_id) -> messages this hour
         self.warned_users = set()  # Set of (chat_id, user_id) who have been warned recently
         
-        # Regex patterns for common spam types
-        self.spam_patterns = [
+        # Regex patterns for common spam types, compiled once. They are matched against
+        # casefolded text, so they are written in lowercase and compiled case-sensitive.
+        # Only whether a pattern occurs matters, so repeats are bounded ({5} finds any run of 5+)
+        crypto_keyword = r'\b(?:bitcoin|btc|ethereum|eth|crypto|whitepaper|ico|token sale)\b'
+        self.spam_patterns = [re.compile(pattern) for pattern in [
             # URLs with certain suspicious TLDs
-            r'https?://\S+\.(xyz|tk|ml|ga|cf|gq|top|loan|online|vip|win)\b',
+            r'https?://\S+\.(?:xyz|tk|ml|ga|cf|gq|top|loan|online|vip|win)\b',
             # Cryptocurrency spam
-            r'\b(bitcoin|btc|ethereum|eth|crypto|whitepaper|ico|token sale)\b.*\bhttps?://\S+\b',
+            crypto_keyword + r'.*\bhttps?://\S+\b',
             # Multiple @mentions
-            r'(@\w+\s*){5,}',
+            r'(?:@\w+\s*){5}',
             # Common spam phrases
-            r'\b(free money|make money online|earn from home|double your investment)\b',
+            r'\b(?:free money|make money online|earn from home|double your investment)\b',
             # Excessive use of emojis
-            r'[😀-🙏]{8,}',
-        ]
+            r'[😀-🙏]{8}',
+        ]]
+        # Hyperscan runs any pattern in linear time, but re retries `.*` up to the end of
+        # the line from every keyword (quadratic on keyword-stuffed texts); its version of
+        # the crypto pattern stops each scan at the next keyword instead
+        self._re_spam_sources = {
+            crypto_keyword + r'.*\bhttps?://\S+\b':
+                crypto_keyword + rf'(?:(?!{crypto_keyword}).)*\bhttps?://\S+\b',
+        }
+        self.url_pattern = re.compile(r'https?://\S+')
+        self.matches_spam_pattern = self._build_spam_matcher()
         
         # Global and per-chat blacklisted words
         self.global_blacklist = set([
@@ -63,17 +147,20 @@ class AntiSpamPlugin(PluginBase):
         ])
         self.chat_blacklists = defaultdict(set)
         
-        # Flood control settings (configurable per chat)
-        self.flood_settings = defaultdict(lambda: {
-            'messages_per_minute': 10,  # Default max messages per minute
-            'similar_messages_limit': 3,  # Default max similar messages
-            'max_forwards': 5,  # Default max forwards
-            'url_limit': 3,  # Default max URLs
-            'action': 'warn'  # Default action: 'warn', 'mute', 'kick', 'ban'
-        })
+        # Entries that are not a single word (e.g. "t.me/", "free-money") can't be found among
+        # the text's words: chat_id -> (Aho-Corasick automaton or None, entries) over the global
+        # and chat ones, built on first use and dropped when the chat's list changes
+        self._blacklist_phrases: Dict[int, Tuple[Any, Tuple[str, ...]]] = {}
+        
+        # Chats where an admin turned anti-spam off (/antispam off)
+        self.disabled_chats: Set[int] = set()
+        
+        # Flood control settings; chats without custom settings share the defaults
+        self.flood_settings: Dict[int, FloodConfig] = {}
+        self.default_flood_config = FloodConfig()
         
         # User tracking for raid detection
-        self.join_history = defaultdict(list)  # chat_id -> [(user_id, timestamp), ...]
+        self.join_history = defaultdict(deque)  # chat_id -> deque([(user_id, timestamp), ...]), oldest first
         
         # Register handlers
         self.router.message(Command("antispam"))(self.cmd_antispam)
@@ -84,26 +171,248 @@ class AntiSpamPlugin(PluginBase):
         # Message handler
         self.router.message()(self.on_message)
         
-        # Setup regular cleanup task
-        self.cleanup_task = None
+        # (chat_id, user_id) pairs with a pending _prune_user call; a user's history and
+        # recent texts are dropped once they have all expired
+        self._prune_scheduled: Set[Tuple[int, int]] = set()
+        
+        # Delayed actions (un-warning users, deleting notices, pruning), run by a single task:
+        # heap of (due at loop time, sequence number, callback)
+        self._expiry_heap: List[Tuple[float, int, Callable[[], Any]]] = []
+        self._expiry_sequence = itertools.count()
+        self._expiry_wakeup: Optional[asyncio.Event] = None
+        self._expiry_task = None
+        
+        # Message deletions are collected per chat for delete_window seconds and sent
+        # as deleteMessages requests, so a raid doesn't cost one request per message
+        self.delete_window = 0.05
+        self._pending_deletes: Dict[int, List[int]] = {}
+        
+        # Texts at least this long are checked in a worker thread, so a long message
+        # doesn't hold up the event loop for the whole scan
+        self.offload_text_length = 1024
+        self._executor: Optional[ThreadPoolExecutor] = None
     
     async def activate(self) -> bool:
         """Activate the plugin"""
         logger.info(f"Activating {self.metadata.name} plugin...")
         
-        # Start cleanup task
-        self.cleanup_task = asyncio.create_task(self.cleanup_history_task())
+        # Start the delayed action task, with the hourly cleanup as its first action
+        self._expiry_wakeup = asyncio.Event()
+        self._expiry_task = asyncio.create_task(self._run_expiry_heap())
+        self.schedule(3600, self._hourly_cleanup)
+        
+        # One worker: the checks hold the GIL, so more threads wouldn't run them faster
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="antispam")
         
         return await super().activate()
     
     async def deactivate(self) -> bool:
         """Deactivate the plugin"""
-        # Cancel cleanup task
-        if self.cleanup_task and not self.cleanup_task.done():
-            self.cleanup_task.cancel()
+        # Cancel the delayed action task and forget its actions and what they were tracking
+        if self._expiry_task and not self._expiry_task.done():
+            self._expiry_task.cancel()
+        self._expiry_heap.clear()
+        self._pending_deletes.clear()  # their flushes were on the heap
+        self._prune_scheduled.clear()
+        self.message_history.clear()
+        self.recent_texts.clear()
+        self.warned_users.clear()
+        
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
             
         return await super().deactivate()
     
+    def _build_spam_matcher(self) -> Callable[[str], bool]:
+        """Build a function telling whether a casefolded text matches any spam pattern, in one pass
+        
+        Uses a Hyperscan multi-pattern database when available; otherwise the
+        patterns are fused into a single regex alternation.
+        """
+        sources = [pattern.pattern for pattern in self.spam_patterns]
+        
+        if hyperscan is not None:
+            try:
+                db = hyperscan.Database()
+                flags = (
+                    hyperscan.HS_FLAG_UTF8 | hyperscan.HS_FLAG_UCP | hyperscan.HS_FLAG_SINGLEMATCH
+                )
+                db.compile(
+                    expressions=[source.encode() for source in sources],
+                    ids=list(range(len(sources))),
+                    flags=[flags] * len(sources)
+                )
+                # Scratch space can't be shared between threads; each thread gets its own
+                local = threading.local()
+                local.scratch = hyperscan.Scratch(db)
+                
+                def matches_hyperscan(text: str) -> bool:
+                    scratch = getattr(local, "scratch", None)
+                    if scratch is None:
+                        scratch = local.scratch = hyperscan.Scratch(db)
+                    
+                    matched = []
+                    db.scan(
+                        text.encode(),
+                        match_event_handler=lambda pattern_id, start, end, flags, context: matched.append(pattern_id),
+                        scratch=scratch
+                    )
+                    return bool(matched)
+                
+                return matches_hyperscan
+            except Exception as e:
+                logger.warning(f"Could not compile spam patterns with Hyperscan, using re: {e}")
+        
+        combined = re.compile("|".join(f"(?:{self._re_spam_sources.get(source, source)})" for source in sources))
+        return lambda text: combined.search(text) is not None
+    
+    @staticmethod
+    def _build_blacklist_automaton(words: Tuple[str, ...]) -> Any:
+        """Build an Aho-Corasick automaton finding any of the words (None without pyahocorasick)"""
+        if ahocorasick is None or not words:
+            return None
+        
+        automaton = ahocorasick.Automaton()
+        for word in words:
+            automaton.add_word(word, word)
+        automaton.make_automaton()
+        return automaton
+    
+    def _get_blacklist_phrases(self, chat_id: int) -> Tuple[Any, Tuple[str, ...]]:
+        """Get the chat's (automaton or None, entries) for blacklist entries that aren't single words"""
+        phrases = self._blacklist_phrases.get(chat_id)
+        if phrases is None:
+            entries = tuple(
+                word for word in self.global_blacklist.union(self.chat_blacklists.get(chat_id, ()))
+                if not _WORD_RE.fullmatch(word)
+            )
+            phrases = self._blacklist_phrases[chat_id] = (self._build_blacklist_automaton(entries), entries)
+        return phrases
+    
+    def _find_blacklisted_word(
+        self,
+        text: str,
+        chat_words: Optional[Set[str]],
+        phrases: Tuple[Any, Tuple[str, ...]]
+    ) -> Optional[str]:
+        """Find a global or chat blacklisted word in the (casefolded) text
+        
+        Args:
+            chat_words: The chat's own blacklisted words
+            phrases: The chat's entry from _get_blacklist_phrases
+        """
+        # Whole-word entries: a set intersection with the text's words
+        words = set(_WORD_RE.findall(text))
+        found = self.global_blacklist & words or (chat_words & words if chat_words else None)
+        if found:
+            return next(iter(found))
+        
+        # Other entries: substring search
+        automaton, entries = phrases
+        if automaton is not None:
+            for _, word in automaton.iter(text):
+                return word
+            return None
+        
+        for word in entries:
+            if word in text:
+                return word
+        return None
+    
+    def get_flood_config(self, chat_id: int) -> FloodConfig:
+        """Get a chat's anti-spam settings (the shared defaults if never changed)"""
+        return self.flood_settings.get(chat_id, self.default_flood_config)
+    
+    def edit_flood_config(self, chat_id: int) -> FloodConfig:
+        """Get a chat's own anti-spam settings for modification, creating them if needed"""
+        config = self.flood_settings.get(chat_id)
+        if config is None:
+            config = self.flood_settings[chat_id] = FloodConfig()
+        return config
+    
+    def schedule(self, delay: float, callback: Callable[[], Any]) -> None:
+        """Run callback (a function or coroutine function) after delay seconds"""
+        due = asyncio.get_running_loop().time() + delay
+        heapq.heappush(self._expiry_heap, (due, next(self._expiry_sequence), callback))
+        
+        # Wake the runner if this is now the earliest action
+        if self._expiry_wakeup is not None and self._expiry_heap[0][2] is callback:
+            self._expiry_wakeup.set()
+    
+    async def _run_expiry_heap(self):
+        """Run scheduled callbacks as they come due"""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                self._expiry_wakeup.clear()
+                if not self._expiry_heap:
+                    await self._expiry_wakeup.wait()
+                    continue
+                
+                delay = self._expiry_heap[0][0] - loop.time()
+                if delay > 0:
+                    # Sleep until the earliest action, or until an earlier one is scheduled
+                    try:
+                        await asyncio.wait_for(self._expiry_wakeup.wait(), timeout=delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                
+                _, _, callback = heapq.heappop(self._expiry_heap)
+                try:
+                    result = callback()
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception as e:
+                    logger.debug(f"Scheduled antispam action failed: {e}")
+        except asyncio.CancelledError:
+            logger.debug("Delayed action task cancelled")
+    
+    def queue_delete(self, bot: Bot, chat_id: int, message_id: int) -> None:
+        """Delete a message with the next batched deleteMessages request for its chat"""
+        pending = self._pending_deletes.get(chat_id)
+        if pending is None:
+            pending = self._pending_deletes[chat_id] = []
+            self.schedule(self.delete_window, partial(self._flush_deletes, bot, chat_id))
+        pending.append(message_id)
+    
+    async def _flush_deletes(self, bot: Bot, chat_id: int):
+        """Delete a chat's queued messages, up to 100 per request"""
+        message_ids = self._pending_deletes.pop(chat_id, [])
+        for i in range(0, len(message_ids), 100):
+            batch = message_ids[i:i + 100]
+            try:
+                await bot.delete_messages(chat_id=chat_id, message_ids=batch)
+            except Exception as e:
+                logger.debug(f"Could not delete messages {batch} in chat {chat_id}: {e}")
+    
+    @staticmethod
+    async def _kick(message: Message, user_id: int):
+        """Remove a user from the message's chat without banning them (Telegram has no kick call)"""
+        await message.chat.ban(user_id=user_id)
+        await message.chat.unban(user_id=user_id, only_if_banned=True)
+    
+    async def _act_and_announce(self, message: Message, action: Awaitable, text: str):
+        """Run a moderation request and send its announcement concurrently
+        
+        The announcement is deleted after 30 seconds, or right away if the action failed.
+        """
+        result, notice = await asyncio.gather(
+            action, message.chat.send_message(text), return_exceptions=True
+        )
+        
+        if isinstance(notice, Message):
+            delete_notice = partial(self.queue_delete, message.bot, notice.chat.id, notice.message_id)
+            if isinstance(result, BaseException):
+                delete_notice()
+            else:
+                self.schedule(30, delete_notice)
+        
+        for outcome in (result, notice):
+            if isinstance(outcome, BaseException):
+                raise outcome
+    
     def get_handlers(self) -> Dict[str, Callable]:
         """Get plugin command handlers"""
         return {
@@ -144,27 +453,27 @@ class AntiSpamPlugin(PluginBase):
         
         if args[0] == "status":
             # Show current settings
-            settings = self.flood_settings[chat_id]
+            config = self.get_flood_config(chat_id)
             status_text = (
                 f"🛡 <b>Anti-Spam Status for this chat</b>\n\n"
-                f"• Messages per minute limit: {settings['messages_per_minute']}\n"
-                f"• Similar message limit: {settings['similar_messages_limit']}\n"
-                f"• Maximum forwards: {settings['max_forwards']}\n"
-                f"• URL limit: {settings['url_limit']}\n"
-                f"• Action on violation: {settings['action'].upper()}\n"
+                f"• Protection: {'OFF' if chat_id in self.disabled_chats else 'ON'}\n"
+                f"• Messages per minute limit: {config.messages_per_minute}\n"
+                f"• Similar message limit: {config.similar_messages_limit}\n"
+                f"• Maximum forwards: {config.max_forwards}\n"
+                f"• URL limit: {config.url_limit}\n"
+                f"• Action on violation: {config.action.upper()}\n"
                 f"• Custom blacklisted words: {len(self.chat_blacklists[chat_id])}\n"
             )
             await message.reply(status_text)
             
         elif args[0] == "on":
             # Enable anti-spam
-            # This would typically update a database record
-            # For now, we'll just reply with a confirmation
+            self.disabled_chats.discard(chat_id)
             await message.reply("✅ Anti-spam protection has been enabled for this chat.")
             
         elif args[0] == "off":
             # Disable anti-spam
-            # This would typically update a database record
+            self.disabled_chats.add(chat_id)
             await message.reply("⚠️ Anti-spam protection has been disabled for this chat.")
             
         else:
@@ -200,6 +509,7 @@ class AntiSpamPlugin(PluginBase):
             # Add word to blacklist
             word = args[1].lower()
             self.chat_blacklists[chat_id].add(word)
+            self._blacklist_phrases.pop(chat_id, None)
             await message.reply(f"✅ Added '{word}' to the blacklist.")
             
         elif args[0] == "remove" and len(args) > 1:
@@ -207,6 +517,7 @@ class AntiSpamPlugin(PluginBase):
             word = args[1].lower()
             if word in self.chat_blacklists[chat_id]:
                 self.chat_blacklists[chat_id].remove(word)
+                self._blacklist_phrases.pop(chat_id, None)
                 await message.reply(f"✅ Removed '{word}' from the blacklist.")
             else:
                 await message.reply(f"❌ '{word}' is not in the blacklist.")
@@ -240,15 +551,15 @@ class AntiSpamPlugin(PluginBase):
         
         if not args:
             # Show current settings and configuration options
-            settings = self.flood_settings[chat_id]
+            config = self.get_flood_config(chat_id)
             settings_text = (
                 f"⚙️ <b>Anti-Spam Settings</b>\n\n"
                 f"Current settings:\n"
-                f"• Messages per minute: {settings['messages_per_minute']}\n"
-                f"• Similar messages: {settings['similar_messages_limit']}\n"
-                f"• Max forwards: {settings['max_forwards']}\n"
-                f"• URL limit: {settings['url_limit']}\n"
-                f"• Action: {settings['action']}\n\n"
+                f"• Messages per minute: {config.messages_per_minute}\n"
+                f"• Similar messages: {config.similar_messages_limit}\n"
+                f"• Max forwards: {config.max_forwards}\n"
+                f"• URL limit: {config.url_limit}\n"
+                f"• Action: {config.action}\n\n"
                 f"To change a setting, use:\n"
                 f"/spamsettings [setting] [value]\n\n"
                 f"Available settings:\n"
@@ -274,7 +585,7 @@ class AntiSpamPlugin(PluginBase):
                 if val < 5 or val > 50:
                     await message.reply("❌ Value must be between 5 and 50.")
                     return
-                self.flood_settings[chat_id]['messages_per_minute'] = val
+                self.edit_flood_config(chat_id).messages_per_minute = val
                 
             elif setting == "similar":
                 # Set similar messages limit
@@ -282,7 +593,7 @@ class AntiSpamPlugin(PluginBase):
                 if val < 2 or val > 10:
                     await message.reply("❌ Value must be between 2 and 10.")
                     return
-                self.flood_settings[chat_id]['similar_messages_limit'] = val
+                self.edit_flood_config(chat_id).similar_messages_limit = val
                 
             elif setting == "forwards":
                 # Set max forwards
@@ -290,7 +601,7 @@ class AntiSpamPlugin(PluginBase):
                 if val < 3 or val > 20:
                     await message.reply("❌ Value must be between 3 and 20.")
                     return
-                self.flood_settings[chat_id]['max_forwards'] = val
+                self.edit_flood_config(chat_id).max_forwards = val
                 
             elif setting == "urls":
                 # Set URL limit
@@ -298,14 +609,14 @@ class AntiSpamPlugin(PluginBase):
                 if val < 1 or val > 10:
                     await message.reply("❌ Value must be between 1 and 10.")
                     return
-                self.flood_settings[chat_id]['url_limit'] = val
+                self.edit_flood_config(chat_id).url_limit = val
                 
             elif setting == "action":
                 # Set action
                 if value not in ["warn", "mute", "kick", "ban"]:
                     await message.reply("❌ Action must be one of: warn, mute, kick, ban.")
                     return
-                self.flood_settings[chat_id]['action'] = value
+                self.edit_flood_config(chat_id).action = value
                 
             else:
                 await message.reply("❌ Unknown setting. Use /spamsettings for help.")
@@ -328,124 +639,143 @@ class AntiSpamPlugin(PluginBase):
             return
         
         chat_id = message.chat.id
+        if chat_id in self.disabled_chats:
+            return
+        
         user_id = message.from_user.id
         now = time.time()
         
         # Get spam settings for this chat
-        settings = self.flood_settings[chat_id]
+        config = self.get_flood_config(chat_id)
         
-        # Add message to history
-        self.message_history[chat_id].append((user_id, now))
+        # Add message to the user's history, dropping entries older than the window
+        timestamps = self.message_history.get((chat_id, user_id))
+        if timestamps is None:
+            timestamps = self.message_history[(chat_id, user_id)] = array('d')
+        timestamps.append(now)
+        if (chat_id, user_id) not in self._prune_scheduled:
+            self._prune_scheduled.add((chat_id, user_id))
+            self.schedule(self.similar_window, partial(self._prune_user, (chat_id, user_id)))
         
-        # Count messages for this user in the last minute
-        one_minute_ago = now - 60
-        self.user_message_counts[chat_id][user_id] += 1
+        # Timestamps are appended in order, so the expired ones are a prefix
+        cutoff = now - self.flood_window
+        if timestamps[0] <= cutoff:
+            del timestamps[:bisect_right(timestamps, cutoff)]
+        recent_count = len(timestamps)
         
-        # === Flood Detection ===
-        # Count messages in the last minute
-        recent_messages = [
-            (uid, ts) for uid, ts in self.message_history[chat_id]
-            if ts > one_minute_ago and uid == user_id
-        ]
+        self.user_message_counts[(chat_id, user_id)] += 1
         
-        if len(recent_messages) > settings['messages_per_minute']:
+        # === Flood Detection ===
+        if recent_count > config.messages_per_minute:
             # User is flooding the chat
             await self.handle_spam_detected(
                 message,
                 "flood",
-                f"Sending too many messages ({len(recent_messages)} messages in 1 minute)"
+                f"Sending too many messages ({recent_count} messages in 1 minute)",
+                now
             )
             return
         
         # === Content Analysis ===
-        # Check for blacklisted words
-        text = message.text.lower()
-        found_blacklist = False
-        blacklisted_word = None
+        # Casefold once; every check below works on this copy
+        text = message.text.casefold()
         
-        # Check global blacklist
-        for word in self.global_blacklist:
-            if word in text:
-                found_blacklist = True
-                blacklisted_word = word
-                break
-        
-        # Check chat-specific blacklist
-        if not found_blacklist:
-            for word in self.chat_blacklists[chat_id]:
-                if word in text:
-                    found_blacklist = True
-                    blacklisted_word = word
-                    break
-        
-        if found_blacklist:
-            await self.handle_spam_detected(
-                message,
-                "blacklist",
-                f"Message contains blacklisted word: '{blacklisted_word}'"
-            )
-            return
+        chat_words = self.chat_blacklists.get(chat_id)
+        phrases = self._get_blacklist_phrases(chat_id)
         
-        # Check for spam patterns
-        for pattern in self.spam_patterns:
-            if re.search(pattern, text, re.IGNORECASE):
-                await self.handle_spam_detected(
-                    message,
-                    "pattern",
-                    "Message matches spam pattern"
-                )
-                return
-        
-        # Check for too many URLs
-        urls = re.findall(r'https?://\S+', text)
-        if len(urls) > settings['url_limit']:
-            await self.handle_spam_detected(
-                message,
-                "urls",
-                f"Too many URLs in message ({len(urls)})"
+        if len(text) >= self.offload_text_length and self._executor is not None:
+            # /blacklist changes the chat's set on this thread; the worker gets a copy
+            detected = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._classify_text, text, config,
+                frozenset(chat_words) if chat_words else None, phrases
             )
+        else:
+            detected = self._classify_text(text, config, chat_words, phrases)
+        
+        if detected is not None:
+            spam_type, reason = detected
+            await self.handle_spam_detected(message, spam_type, reason, now)
             return
         
         # Check for forwarded messages (if user forwards many in a short time)
         if message.forward_date:
-            forward_count = sum(
-                1 for (uid, ts) in self.message_history[chat_id]
-                if uid == user_id and ts > one_minute_ago and message.forward_date
-            )
+            forward_count = recent_count
             
-            if forward_count > settings['max_forwards']:
+            if forward_count > config.max_forwards:
                 await self.handle_spam_detected(
                     message,
                     "forwards",
-                    f"Forwarding too many messages ({forward_count} in 1 minute)"
+                    f"Forwarding too many messages ({forward_count} in 1 minute)",
+                    now
                 )
                 return
         
         # === Similar Message Detection ===
-        # Get recent messages from this user
-        recent_user_messages = [
-            msg.text for msg in message.chat.message_history.cache 
-            if msg.from_user and msg.from_user.id == user_id and msg.text
-        ]
-        
-        # Count occurrences of this message
-        if recent_user_messages:
-            message_counts = Counter(recent_user_messages)
-            
-            if message_counts[message.text] > settings['similar_messages_limit']:
-                await self.handle_spam_detected(
-                    message,
-                    "similar",
-                    f"Sending similar messages repeatedly ({message_counts[message.text]} times)"
-                )
-                return
+        # Compare this text's fingerprint with the user's recent ones, so
+        # near-duplicates (a changed word, added punctuation) count too
+        text_log = self.recent_texts.get((chat_id, user_id))
+        if text_log is None:
+            text_log = self.recent_texts[(chat_id, user_id)] = deque()
+        while text_log and text_log[0][0] <= now:
+            text_log.popleft()
+        
+        fingerprint = simhash(text)
+        similar_count = 1 + sum(
+            1 for _, other in text_log
+            if bin(fingerprint ^ other).count("1") <= self.similar_max_distance
+        )
+        text_log.append((now + self.similar_window, fingerprint))
+        
+        if similar_count > config.similar_messages_limit:
+            await self.handle_spam_detected(
+                message,
+                "similar",
+                f"Sending similar messages repeatedly ({similar_count} times)",
+                now
+            )
+            return
+    
+    def _classify_text(
+        self,
+        text: str,
+        config: FloodConfig,
+        chat_words: Optional[Set[str]],
+        phrases: Tuple[Any, Tuple[str, ...]]
+    ) -> Optional[Tuple[str, str]]:
+        """Check a casefolded text's content, returning (spam type, reason) if it is spam
+        
+        Doesn't touch mutable plugin state, so it can run in a worker thread when
+        given a copy of the chat's blacklisted words.
+        """
+        # Check for blacklisted words
+        blacklisted_word = self._find_blacklisted_word(text, chat_words, phrases)
+        if blacklisted_word is not None:
+            return "blacklist", f"Message contains blacklisted word: '{blacklisted_word}'"
+        
+        # Check for spam patterns
+        if self.matches_spam_pattern(text):
+            return "pattern", "Message matches spam pattern"
+        
+        # Check for too many URLs
+        # Most messages have no links; the substring check is far cheaper than the regex
+        urls = self.url_pattern.findall(text) if "http" in text else ()
+        if len(urls) > config.url_limit:
+            return "urls", f"Too many URLs in message ({len(urls)})"
+        
+        return None
     
-    async def handle_spam_detected(self, message: Message, spam_type: str, reason: str):
-        """Handle detected spam with appropriate action"""
+    async def handle_spam_detected(self, message: Message, spam_type: str, reason: str, now: Optional[float] = None):
+        """Handle detected spam with appropriate action
+        
+        Args:
+            now: Unix time the message was processed at (read from the clock if not given)
+        """
+        if now is None:
+            now = time.time()
         chat_id = message.chat.id
         user_id = message.from_user.id
-        settings = self.flood_settings[chat_id]
-        action = settings['action']
+        config = self.get_flood_config(chat_id)
+        action = config.action
         
         # Check if this user was recently warned (to avoid duplicate warnings)
         recently_warned = (chat_id, user_id) in self.warned_users
@@ -458,7 +788,7 @@ class AntiSpamPlugin(PluginBase):
         
         try:
             # Always delete the spam message
-            await message.delete()
+            self.queue_delete(message.bot, chat_id, message.message_id)
             
             # Take action based on settings
             if action == "warn" and not recently_warned:
@@ -468,81 +798,50 @@ class AntiSpamPlugin(PluginBase):
                     f"please don't spam! Reason: {reason}"
                 )
                 
-                # Add to warned users set
+                # Add to warned users set, removing them again after 5 minutes
                 self.warned_users.add((chat_id, user_id))
-                
-                # Set a timeout to remove from warned set after 5 minutes
-                async def remove_warned():
-                    await asyncio.sleep(300)  # 5 minutes
-                    self.warned_users.discard((chat_id, user_id))
-                
-                asyncio.create_task(remove_warned())
+                self.schedule(300, lambda: self.warned_users.discard((chat_id, user_id)))
                 
                 # Delete warning after 30 seconds
-                async def delete_warning():
-                    await asyncio.sleep(30)
-                    await warn_msg.delete()
-                
-                asyncio.create_task(delete_warning())
+                self.schedule(30, partial(self.queue_delete, message.bot, chat_id, warn_msg.message_id))
                 
             elif action == "mute" or (action == "warn" and recently_warned):
                 # Mute the user for 10 minutes
-                until_date = datetime.now() + timedelta(minutes=10)
+                until_date = int(now) + 600
                 
-                await message.chat.restrict(
-                    user_id=user_id,
-                    permissions={
-                        "can_send_messages": False,
-                        "can_send_media_messages": False,
-                        "can_send_other_messages": False,
-                        "can_add_web_page_previews": False
-                    },
-                    until_date=until_date
-                )
-                
-                mute_msg = await message.chat.send_message(
+                await self._act_and_announce(
+                    message,
+                    message.chat.restrict(
+                        user_id=user_id,
+                        permissions={
+                            "can_send_messages": False,
+                            "can_send_media_messages": False,
+                            "can_send_other_messages": False,
+                            "can_add_web_page_previews": False
+                        },
+                        until_date=until_date
+                    ),
                     f"🔇 {message.from_user.full_name} has been muted for 10 minutes due to spam.\n"
                     f"Reason: {reason}"
                 )
                 
-                # Delete notification after 30 seconds
-                async def delete_notification():
-                    await asyncio.sleep(30)
-                    await mute_msg.delete()
-                
-                asyncio.create_task(delete_notification())
-                
             elif action == "kick":
                 # Kick the user
-                await message.chat.kick(user_id=user_id)
-                
-                kick_msg = await message.chat.send_message(
+                await self._act_and_announce(
+                    message,
+                    self._kick(message, user_id),
                     f"👢 {message.from_user.full_name} has been kicked for spamming.\n"
                     f"Reason: {reason}"
                 )
                 
-                # Delete notification after 30 seconds
-                async def delete_notification():
-                    await asyncio.sleep(30)
-                    await kick_msg.delete()
-                
-                asyncio.create_task(delete_notification())
-                
             elif action == "ban":
                 # Ban the user
-                await message.chat.ban(user_id=user_id)
-                
-                ban_msg = await message.chat.send_message(
+                await self._act_and_announce(
+                    message,
+                    message.chat.ban(user_id=user_id),
                     f"🚫 {message.from_user.full_name} has been banned for spamming.\n"
                     f"Reason: {reason}"
                 )
-                
-                # Delete notification after 30 seconds
-                async def delete_notification():
-                    await asyncio.sleep(30)
-                    await ban_msg.delete()
-                
-                asyncio.create_task(delete_notification())
             
             # Send event for other components to process
             await event_manager.publish("spam:detected", {
@@ -552,42 +851,43 @@ class AntiSpamPlugin(PluginBase):
                 "spam_type": spam_type,
                 "reason": reason,
                 "action_taken": action,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": now
             })
             
         except Exception as e:
             logger.error(f"Error handling spam: {e}")
     
-    async def cleanup_history_task(self):
-        """Task to clean up old message history entries"""
-        try:
-            while True:
-                await asyncio.sleep(60)  # Run every minute
-                
-                now = time.time()
-                one_hour_ago = now - 3600
-                
-                # Clean up message history
-                for chat_id in self.message_history:
-                    self.message_history[chat_id] = [
-                        (uid, ts) for uid, ts in self.message_history[chat_id]
-                        if ts > one_hour_ago
-                    ]
-                
-                # Clean up user message counts
-                for chat_id in self.user_message_counts:
-                    # Reset counts that are more than an hour old
-                    self.user_message_counts[chat_id] = defaultdict(int)
-                
-                # Clean up join history
-                for chat_id in self.join_history:
-                    self.join_history[chat_id] = [
-                        (uid, ts) for uid, ts in self.join_history[chat_id]
-                        if ts > one_hour_ago
-                    ]
-                
-        except asyncio.CancelledError:
-            # Task was canceled, clean up
-            logger.debug("Cleanup task cancelled")
-        except Exception as e:
-            logger.error(f"Error in cleanup task: {e}") 
\ No newline at end of file
+    def _prune_user(self, key: Tuple[int, int]):
+        """Forget a user's history once it has expired, or check again when it will have"""
+        now = time.time()
+        timestamps = self.message_history.get(key)
+        text_log = self.recent_texts.get(key)
+        expires_at = max(
+            timestamps[-1] + self.flood_window if timestamps else 0,
+            text_log[-1][0] if text_log else 0
+        )
+        
+        if expires_at > now:
+            self.schedule(expires_at - now, partial(self._prune_user, key))
+            return
+        
+        self.message_history.pop(key, None)
+        self.recent_texts.pop(key, None)
+        self._prune_scheduled.discard(key)
+    
+    def _hourly_cleanup(self):
+        """Reset message counts and drop joins older than an hour, then schedule the next run"""
+        one_hour_ago = time.time() - 3600
+        
+        # Reset user message counts
+        self.user_message_counts.clear()
+        
+        # Clean up join history, dropping expired joins from the old end
+        for chat_id in list(self.join_history):
+            joins = self.join_history[chat_id]
+            while joins and joins[0][1] <= one_hour_ago:
+                joins.popleft()
+            if not joins:
+                del self.join_history[chat_id]
+        
+        self.schedule(3600, self._hourly_cleanup)
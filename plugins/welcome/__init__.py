@@ -16,6 +16,7 @@ from app.plugins.plugin_manager import PluginBase, PluginMetadata
 from app.services.user_service import user_service
 from app.models.user import User, UserRole
 from app.utils.decorators import admin_required, moderator_required, log_command, chat_type
+from app.utils.permissions import current_permissions
 
 
 class WelcomeStates(StatesGroup):
@@ -690,6 +691,11 @@ class WelcomePlugin(PluginBase):
     
     async def check_user_is_admin(self, chat_id: int, user_id: int) -> bool:
         """Check if user is an admin"""
+        # The sender of the current message was already resolved by UserContextMiddleware
+        permissions = current_permissions.get()
+        if permissions.chat_id == chat_id and permissions.user_id == user_id and permissions.chat_status:
+            return permissions.is_chat_admin
+        
         try:
             chat_member = await self.bot.get_chat_member(chat_id, user_id)
             return chat_member.status in ["administrator", "creator"]
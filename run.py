@@ -117,6 +117,10 @@ async def shutdown(cache_service=None, event_manager=None, bot=None):
             await stop_bot()
             logger.info("Bot stopped successfully.")
         
+        # Record pool usage before the process goes away
+        from app.database.session import get_pool_status
+        logger.info(f"Database pool status: {get_pool_status()}")
+        
         # Disconnect from cache
         if cache_service:
             logger.info("Disconnecting from cache service...")
@@ -135,12 +139,14 @@ async def shutdown(cache_service=None, event_manager=None, bot=None):
 
 if __name__ == "__main__":
     try:
-        # Configure logging
+        # Configure logging; enqueue=True hands records to a writer thread,
+        # so handlers (e.g. command logging) never block the event loop on I/O
         logger.remove()
         logger.add(
             sys.stderr,
             format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-            level="DEBUG"  # Changed to DEBUG for more detailed logs
+            level="DEBUG",  # Changed to DEBUG for more detailed logs
+            enqueue=True
         )
         
         # Ensure logs directory exists
@@ -152,11 +158,17 @@ if __name__ == "__main__":
             retention="1 week",
             compression="zip",
             format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
-            level="DEBUG"  # Changed to DEBUG for more detailed logs
+            level="DEBUG",  # Changed to DEBUG for more detailed logs
+            enqueue=True
         )
         
         logger.info("Starting MyChatManager Bot in DEBUG mode")
         
+        # Use the faster libuv-based event loop when available
+        from app.utils.helpers import install_uvloop
+        if install_uvloop():
+            logger.info("Using uvloop event loop")
+        
         # Run the bot
         asyncio.run(startup())
         
@@ -0,0 +1,65 @@
+import time
+
+import pytest
+
+from app.api.middlewares import TokenBucket
+from plugins.antispam import simhash
+
+
+def distance(a: int, b: int) -> int:
+    """Number of differing fingerprint bits"""
+    return bin(a ^ b).count("1")
+
+
+def test_simhash_identical_texts_match():
+    assert simhash("buy cheap followers now") == simhash("buy cheap followers now")
+
+
+def test_simhash_near_duplicates_are_close():
+    original = simhash("join my channel for the best crypto signals every single day")
+    edited = simhash("join my channel for the best crypto signals every day")
+    unrelated = simhash("does anyone know when the meeting starts tomorrow")
+
+    assert distance(original, edited) < distance(original, unrelated)
+    assert distance(original, edited) <= 12
+
+
+def test_simhash_wordless_texts():
+    # Texts without words must not all collapse to the same fingerprint
+    assert simhash("🔥🔥🔥") == simhash("🔥🔥🔥")
+    assert simhash("🔥🔥🔥") != simhash("?!")
+    assert simhash("") != simhash("🔥")
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_allows_burst():
+    bucket = TokenBucket(capacity=5, rate=1)
+
+    started = time.monotonic()
+    for _ in range(5):
+        await bucket.acquire()
+
+    assert time.monotonic() - started < 0.05
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_paces_after_burst():
+    bucket = TokenBucket(capacity=2, rate=20)
+
+    started = time.monotonic()
+    for _ in range(4):
+        await bucket.acquire()
+
+    # Two tokens from the burst, then one every 50ms
+    assert time.monotonic() - started >= 0.09
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_pause():
+    bucket = TokenBucket(capacity=5, rate=100)
+    bucket.pause(0.1)
+
+    started = time.monotonic()
+    await bucket.acquire()
+
+    assert time.monotonic() - started >= 0.09
@@ -0,0 +1,191 @@
+from collections import deque
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.models import base
+from app.models.base import Base
+from app.models.user import User, UserRole
+from app.models.chat import Chat, ChatMember, ChatMemberStatus
+from app.services import user_service as user_service_module
+from app.services.cache_service import CacheService, LRUCache
+from app.services.user_service import user_service
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """A fresh in-memory cache, also used by the user service"""
+    cache = CacheService()
+    cache.connected = True  # no Redis client, so every call takes the in-memory path
+    monkeypatch.setattr(user_service_module, "cache_service", cache)
+    return cache
+
+
+@pytest_asyncio.fixture
+async def db(tmp_path, monkeypatch, cache):
+    """Point the services at a fresh SQLite database"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    monkeypatch.setattr(base, "async_session_factory", sessionmaker(
+        engine,
+        class_=AsyncSession,
+        expire_on_commit=False,
+    ))
+    monkeypatch.setattr(user_service_module, "engine", engine)
+
+    yield engine
+    await engine.dispose()
+
+
+async def get_user(db, user_id: int) -> User:
+    """Read a user straight from the database, bypassing the cache"""
+    async with AsyncSession(db) as session:
+        return (await session.execute(select(User).where(User.id == user_id))).scalar_one()
+
+
+@pytest.mark.asyncio
+async def test_set_user_role_sqlite(db):
+    user = await user_service.create_or_update_user(1001, username="alice")
+
+    assert await user_service.set_user_role(user.id, UserRole.MODERATOR)
+    assert (await get_user(db, user.id)).role == UserRole.MODERATOR
+    assert (await user_service.fetch_auth(1001)).role == UserRole.MODERATOR
+
+
+@pytest.mark.asyncio
+async def test_set_user_role_missing_user(db):
+    assert not await user_service.set_user_role(12345, UserRole.ADMIN)
+
+
+@pytest.mark.asyncio
+async def test_create_or_update_user_keeps_stored_values(db):
+    user = await user_service.create_or_update_user(1002, username="bob", first_name="Bob", language_code="de")
+    await user_service.create_or_update_user(1002, username="", first_name=None, language_code="")
+
+    stored = await get_user(db, user.id)
+    assert stored.username == "bob"
+    assert stored.first_name == "Bob"
+    assert stored.language_code == "de"
+
+
+async def add_member(db, user_id: int, telegram_chat_id: int, max_warnings: int = 3) -> int:
+    """Create a chat with the user as a member and return the chat's database ID"""
+    async with AsyncSession(db) as session:
+        chat = Chat(telegram_id=telegram_chat_id, title="Test chat", chat_type="supergroup", max_warnings=max_warnings)
+        session.add(chat)
+        await session.flush()
+        chat_id = chat.id
+        session.add(ChatMember(chat_id=chat_id, user_id=user_id))
+        await session.commit()
+        return chat_id
+
+
+async def get_member(db, user_id: int, chat_id: int) -> ChatMember:
+    """Read a membership straight from the database"""
+    async with AsyncSession(db) as session:
+        query = select(ChatMember).where((ChatMember.user_id == user_id) & (ChatMember.chat_id == chat_id))
+        return (await session.execute(query)).scalar_one()
+
+
+@pytest.mark.asyncio
+async def test_ban_user_globally(db, cache):
+    user = await user_service.create_or_update_user(1003)
+
+    assert await user_service.ban_user(user.id, reason="spam")
+
+    stored = await get_user(db, user.id)
+    assert stored.is_banned
+    assert stored.role == UserRole.BANNED
+    assert stored.ban_reason == "spam"
+    assert await cache.get("user:role:1003") == UserRole.BANNED
+    assert not await user_service.ban_user(12345)
+
+
+@pytest.mark.asyncio
+async def test_ban_user_in_chat(db):
+    user = await user_service.create_or_update_user(1004)
+    chat_id = await add_member(db, user.id, -1001)
+
+    assert await user_service.ban_user(user.id, chat_id=chat_id)
+
+    member = await get_member(db, user.id, chat_id)
+    assert member.status == ChatMemberStatus.KICKED
+    assert not member.is_active
+    assert not (await get_user(db, user.id)).is_banned
+
+
+@pytest.mark.asyncio
+async def test_warn_user_bans_at_limit(db):
+    user = await user_service.create_or_update_user(1005)
+    chat_id = await add_member(db, user.id, -1002, max_warnings=2)
+
+    first = await user_service.warn_user(user.id, chat_id, reason="rude")
+    assert first["success"] and first["warnings"] == 1 and not first["banned"]
+
+    second = await user_service.warn_user(user.id, chat_id, reason="rude")
+    assert second["success"] and second["warnings"] == 2 and second["banned"]
+    assert (await get_member(db, user.id, chat_id)).status == ChatMemberStatus.KICKED
+
+
+@pytest.mark.asyncio
+async def test_warn_user_not_a_member(db):
+    user = await user_service.create_or_update_user(1006)
+    other = await user_service.create_or_update_user(1007)
+    chat_id = await add_member(db, other.id, -1003)
+
+    result = await user_service.warn_user(user.id, chat_id)
+    assert not result["success"]
+
+    result = await user_service.warn_user(user.id, 999)
+    assert not result["success"]
+
+
+@pytest.mark.asyncio
+async def test_incr_with_ttl_in_memory(cache):
+    assert (await cache.incr_with_ttl("flood:1", 60))[0] == 1
+    assert (await cache.incr_with_ttl("flood:1", 60))[0] == 2
+    count, remaining = await cache.incr_with_ttl("flood:1", 60)
+    assert count == 3
+    assert 0 < remaining <= 60
+
+    # Once the window has passed the count starts over
+    cache.in_memory_ttl["flood:1"] -= 61
+    assert (await cache.incr_with_ttl("flood:1", 60))[0] == 1
+
+
+@pytest.mark.asyncio
+async def test_sliding_window_in_memory(cache):
+    for expected in range(1, 4):
+        count, remaining = await cache.hit_sliding_window("rate:1", 60)
+        assert count == expected
+        assert 0 < remaining <= 60
+
+    # Age the first two hits out of the window
+    hits = cache._windows["rate:1"]
+    cache._windows["rate:1"] = deque([hits[0] - 61, hits[1] - 61, hits[2]])
+
+    count, _ = await cache.hit_sliding_window("rate:1", 60)
+    assert count == 2
+
+
+def test_lru_cache_evicts_least_recently_used():
+    evicted = []
+    lru = LRUCache(max_size=2, on_evict=evicted.append)
+    lru["a"] = 1
+    lru["b"] = 2
+
+    # Reads count as use, so "b" is now the oldest
+    assert lru["a"] == 1
+    lru["c"] = 3
+    assert "b" not in lru and "a" in lru
+
+    assert lru.get("a") == 1
+    lru["d"] = 4
+    assert list(lru) == ["a", "d"]
+    assert evicted == ["b", "c"]
+    assert lru.get("missing", 0) == 0